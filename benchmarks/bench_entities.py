@@ -0,0 +1,117 @@
+"""
+Micro-benchmark for HTML entity encoding.
+
+Builds a synthetic workbook (50k cells by default), then encodes every cell
+with the original per-character scanner and with entities.encode_column. It
+checks that both give identical output and prints the timings.
+
+    python benchmarks/bench_entities.py --cells 50000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from html.entities import codepoint2name, name2codepoint
+
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entities import encode_column, url_pattern  # noqa: E402
+
+WORDS = ["Découvrez", "la", "nouvelle", "collection", "été", "Ã", "offre", "spéciale", "&amp;", "Größe",
+         "–", "«", "»", "€", "Sœur", "naïve", "Bonjour", "&", "&eacute;", "&nope;", "tête-à-tête", "Ø"]
+URLS = ["https://www.example.com/é?a=1&b=2", "http://example.org/path"]
+
+
+def legacy_is_named_entity(text, i):
+    if text[i] == '&':
+        semicolon_index = text.find(';', i)
+        if semicolon_index != -1:
+            entity_candidate = text[i:semicolon_index + 1]
+            if entity_candidate[1:-1] in name2codepoint:
+                return True
+    return False
+
+
+def legacy_convert_to_named_entities(text):
+    # The per-character scanner encode_column replaced, kept as the baseline
+    result = []
+    i = 0
+    while i < len(text):
+        if legacy_is_named_entity(text, i):
+            semicolon_index = text.find(';', i)
+            result.append(text[i:semicolon_index + 1])
+            i = semicolon_index + 1
+        else:
+            code = ord(text[i])
+            if code in codepoint2name:
+                result.append(f"&{codepoint2name[code]};")
+            else:
+                result.append(text[i])
+            i += 1
+    return ''.join(result)
+
+
+def legacy_encode_cell(value):
+    if isinstance(value, str) and not url_pattern.search(value):
+        return legacy_convert_to_named_entities(value)
+    return value
+
+
+def build_workbook(path, cells, columns=2, seed=0):
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Copy")
+    ws.append([f"L{index}" for index in range(columns)])
+    for _ in range(cells // columns):
+        row = []
+        for _ in range(columns):
+            roll = rng.random()
+            if roll < 0.02:
+                row.append(rng.choice(URLS))
+            elif roll < 0.04:
+                row.append(rng.randint(0, 1000))
+            elif roll < 0.05:
+                row.append(None)
+            else:
+                row.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25))))
+        ws.append(row)
+    wb.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cells", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.xlsx")
+        build_workbook(path, args.cells)
+        df = pd.read_excel(path, header=None, dtype=object)
+
+    legacy_best = vector_best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        legacy = df.apply(lambda column: column.map(legacy_encode_cell))
+        legacy_best = min(legacy_best, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        vector = df.apply(encode_column)
+        vector_best = min(vector_best, time.perf_counter() - start)
+
+    if not legacy.equals(vector):
+        sys.exit("encode_column output differs from the legacy encoder")
+
+    print(f"cells:          {df.size}")
+    print(f"legacy encoder: {legacy_best * 1000:.1f} ms")
+    print(f"encode_column:  {vector_best * 1000:.1f} ms")
+    print(f"speedup:        {legacy_best / vector_best:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark the peak memory of reading a large master workbook.
+
+Generates multi-sheet workbooks where the base column FR and a few language
+columns sit among other columns (ids, notes, campaign fields) that the
+pipeline never uses, sweeping the number of rows and of those other columns.
+Each step then runs alone in a fresh process, and the growth of its peak RSS
+over the process's peak after imports is reported:
+
+    extract          extract_columns and language_inputs, the streaming path
+    encode_workbook  process_excel_file rewriting the whole workbook
+    pandas_read      pd.read_excel of every sheet, a whole-workbook load
+    openpyxl_load    openpyxl.load_workbook in normal mode, likewise
+
+The two last are references: they grow with every cell of the workbook,
+while the first two should only grow with the rows of the language columns
+and not at all with the other columns. Results are saved as JSON named after
+the current commit:
+
+    python benchmarks/bench_memory.py                    # writes benchmarks/results/<commit>-memory.json
+    python benchmarks/bench_memory.py --quick
+
+Peak RSS comes from the resource module, so this does not run on Windows.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import RESULTS_DIR, git_commit, language_names, phrases  # noqa: E402
+
+STEPS = ['extract', 'encode_workbook', 'pandas_read', 'openpyxl_load']
+
+BASE = {'rows': 20000, 'languages': 4, 'other_columns': 10}
+SWEEPS = {'rows': [20000, 50000, 100000], 'other_columns': [0, 10, 40]}
+QUICK_BASE = {'rows': 2000, 'languages': 3, 'other_columns': 10}
+QUICK_SWEEPS = {'rows': [2000, 5000, 10000], 'other_columns': [0, 10, 40]}
+
+
+def build_workbook(path, rows, languages, other_columns, sheets=4):
+    """The base column FR, one column per language and other_columns unused text columns, over several sheets."""
+    sources = phrases(rows)
+    wb = Workbook(write_only=True)
+    per_sheet = math.ceil(rows / sheets)
+    others = [f"Field {index}" for index in range(other_columns)]
+    for sheet in range(sheets):
+        ws = wb.create_sheet(f"Campaign {sheet + 1}")
+        ws.append([f"Campaign copy, sheet {sheet + 1}"])
+        ws.append(["ID", "FR"] + languages + others)
+        for index in range(sheet * per_sheet, min(rows, (sheet + 1) * per_sheet)):
+            source = sources[index]
+            ws.append([index, source] + [f"{language} {source}" for language in languages]
+                      + [f"{field} for row {index}: {source}" for field in others])
+    wb.save(path)
+
+
+def measure(step, workbook, languages):
+    """Run one step in this process and return its seconds and peak RSS growth in MB."""
+    import openpyxl
+    import pandas as pd
+
+    from instrumentation import peak_rss_mb
+    from pipeline import extract_columns, language_inputs, process_excel_file
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    if step == 'extract':
+        df = extract_columns(workbook, ['FR'] + languages)
+        language_inputs(df, 'FR', languages)
+    elif step == 'encode_workbook':
+        process_excel_file(workbook)
+    elif step == 'pandas_read':
+        pd.read_excel(workbook, sheet_name=None, header=None, dtype=object)
+    elif step == 'openpyxl_load':
+        openpyxl.load_workbook(workbook, data_only=True)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'peak_mb': peak_rss_mb() - before}
+
+
+def run_step(step, workbook, languages):
+    # A fresh process per step, the peak RSS of a process never goes down
+    command = [sys.executable, os.path.abspath(__file__), '--measure', step, workbook] + languages
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_point(point, work_dir):
+    """Measure every step for one (rows, languages, other_columns) point; returns {step: {seconds, peak_mb}}."""
+    languages = language_names(point['languages'])
+    os.makedirs(work_dir)
+    workbook = os.path.join(work_dir, 'master.xlsx')
+    build_workbook(workbook, point['rows'], languages, point['other_columns'])
+    size_mb = os.path.getsize(workbook) / 1024 / 1024
+
+    measurements = {}
+    for step in STEPS:
+        path = workbook
+        if step == 'encode_workbook':
+            # It rewrites the workbook in place
+            path = os.path.join(work_dir, 'encoded.xlsx')
+            shutil.copyfile(workbook, path)
+        measurements[step] = run_step(step, path, languages)
+    return size_mb, measurements
+
+
+def print_report(results):
+    for dimension, sweep_results in results['sweeps'].items():
+        print(f"\nVarying {dimension} (others at {results['base']}), peak RSS growth in MB (seconds):")
+        sizes = ''.join(f"{dimension + '=' + str(r['point'][dimension]):>22}" for r in sweep_results)
+        print(f"{'step':<18}{sizes}")
+        print(f"{'workbook size':<18}" + ''.join(f"{r['workbook_mb']:>19.1f} MB" for r in sweep_results))
+        for step in STEPS:
+            cells = ''.join(f"{r['steps'][step]['peak_mb']:>13.1f} ({r['steps'][step]['seconds']:>5.1f} s)"
+                            for r in sweep_results)
+            print(f"{step:<18}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, for a fast sanity check")
+    parser.add_argument("--output", help="Where to save the results "
+                                         "(default: benchmarks/results/<commit>-memory.json)")
+    parser.add_argument("--measure", nargs='+', metavar="ARG", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        step, workbook, *languages = args.measure
+        print(json.dumps(measure(step, workbook, languages)))
+        return
+
+    base, sweeps = (QUICK_BASE, QUICK_SWEEPS) if args.quick else (BASE, SWEEPS)
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+               'quick': args.quick, 'base': base, 'sweeps': {}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dimension, sizes in sweeps.items():
+            results['sweeps'][dimension] = []
+            for size in sizes:
+                point = dict(base, **{dimension: size})
+                size_mb, measurements = run_point(point, os.path.join(tmp, f"{dimension}-{size}"))
+                results['sweeps'][dimension].append({'point': point, 'workbook_mb': round(size_mb, 2),
+                                                     'steps': measurements})
+
+    print_report(results)
+    name = f"{results['commit']}-memory{'-quick' if args.quick else ''}.json"
+    output = args.output or os.path.join(RESULTS_DIR, name)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Benchmark the pipeline functions and a full run on synthetic inputs.
+
+Generates multi-sheet workbooks with N strings x L language columns, HTML
+templates of a given size, header/footer folders and an images zip, all in a
+temporary directory. It then times each pipeline step and translate_newsletter
+end to end, sweeping one of strings, languages and template size at a time
+around a base point. At every point it fails if compiling and rendering one
+language from scratch is slower than the original one-re.sub-per-key loop. For every step it reports how the runtime scales: the
+slope of log(time) against log(size) over each sweep, so 1.0 means linear.
+
+Everything is generated locally, no network access is needed. Results are
+saved as JSON named after the current commit, so two commits can be compared:
+
+    python benchmarks/bench_pipeline.py                  # writes benchmarks/results/<commit>.json
+    python benchmarks/bench_pipeline.py --quick
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/abc1234.json benchmarks/results/def5678.json
+"""
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from zipfile import ZipFile
+
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entities import convert_to_named_entities, encode_column  # noqa: E402
+from pipeline import (CompiledTemplate, compile_replacements, extract_columns, inject_header_footer,  # noqa: E402
+                      key_patterns, language_inputs, translate_newsletter)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+WORDS = ["Découvrez", "la", "nouvelle", "collection", "été", "offre", "spéciale", "Größe", "livraison", "gratuite",
+         "dès", "maintenant", "Sœur", "naïve", "Bonjour", "&", "tête-à-tête", "€", "«", "»", "jusqu'à", "moins"]
+
+BASE = {'strings': 2000, 'languages': 5, 'template_kb': 50}
+SWEEPS = {'strings': [500, 2000, 8000], 'languages': [2, 5, 10], 'template_kb': [10, 50, 200]}
+QUICK_BASE = {'strings': 300, 'languages': 3, 'template_kb': 10}
+QUICK_SWEEPS = {'strings': [100, 300, 900], 'languages': [2, 3, 6], 'template_kb': [5, 10, 40]}
+
+HEADER_FOOTER = ("<!--Header Code Start--><div class=\"header\">{language} header</div><!--Header Code End-->"
+                 "<!--Footer Code Start--><div class=\"footer\">{language} footer</div><!--Footer Code End-->")
+
+
+def phrases(count, seed=0):
+    rng = random.Random(seed)
+    # Numbered so every source string is distinct
+    return [f"{' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))} {index}" for index in range(count)]
+
+
+def language_names(count):
+    return [f"L{index:02d}" for index in range(count)]
+
+
+def build_workbook(path, strings, languages, sheets=2):
+    """The base column FR plus one column per language, spread over several sheets, and a BALISES sheet."""
+    sources = phrases(strings)
+    wb = Workbook(write_only=True)
+    per_sheet = math.ceil(strings / sheets)
+    for sheet in range(sheets):
+        ws = wb.create_sheet(f"Copy {sheet + 1}")
+        ws.append([f"Newsletter copy, sheet {sheet + 1}"])
+        ws.append(["ID", "FR"] + languages)
+        for index in range(sheet * per_sheet, min(strings, (sheet + 1) * per_sheet)):
+            ws.append([index, sources[index]] + [f"{language} {sources[index]}" for language in languages])
+    wb.create_sheet("BALISES").append(["tag", "value"])
+    wb.save(path)
+    return sources
+
+
+def build_template(path, sources, template_kb):
+    """
+    An email-like table layout that cycles through the source strings until it is template_kb in size.
+
+    The strings are written entity-encoded, as in a real template, since
+    that is the form the encoded workbook keys are matched in.
+    """
+    parts = ["<!DOCTYPE html><html><head><style>td { font-family: Arial; }</style></head><body>",
+             HEADER_FOOTER.format(language='FR'), "<!--[if mso]><table><tr><td><![endif]-->",
+             "<table width=\"600\" cellpadding=\"0\" cellspacing=\"0\">"]
+    size = sum(map(len, parts))
+    index = 0
+    while size < template_kb * 1024:
+        row = (f"<tr><td class=\"copy\" style=\"padding: 8px;\"><a href=\"https://example.com/{index}\">"
+               f"<img src=\"images/image{index % 4}.png\" alt=\"\"></a>"
+               f"{convert_to_named_entities(sources[index % len(sources)])}</td></tr>")
+        parts.append(row)
+        size += len(row)
+        index += 1
+    parts.append("</table><!--[if mso]></td></tr></table><![endif]--></body></html>")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(''.join(parts))
+
+
+def build_header_footer(directory, languages):
+    for language in languages:
+        os.makedirs(os.path.join(directory, 'Header_and_Footer', language))
+        with open(os.path.join(directory, 'Header_and_Footer', language, 'index.html'), 'w', encoding='utf-8') as file:
+            file.write(f"<html><body>{HEADER_FOOTER.format(language=language)}</body></html>")
+
+
+def png_bytes(width, height, seed):
+    # A noisy RGB image, written without Pillow so the suite only needs the app's own dependencies
+    rng = random.Random(seed)
+    raw = b''.join(b'\x00' + bytes(rng.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def build_images(directory, count=4, size=64):
+    zip_path = os.path.join(directory, 'images.zip')
+    with ZipFile(zip_path, 'w') as zipf:
+        for index in range(count):
+            zipf.writestr(f"Images/image{index}.png", png_bytes(size, size, index))
+    with ZipFile(zip_path) as zipf:
+        zipf.extractall(os.path.join(directory, 'images'))
+    return os.path.join(directory, 'images')
+
+
+def original_replace(content, replacements):
+    """The substitution loop the pipeline started from, one re.sub per key, kept as the reference to beat."""
+    for old, new in sorted(replacements.items(), key=lambda item: len(item[0]), reverse=True):
+        pattern = re.escape(old).replace(r'\ ', r'(\s*|&nbsp;)')
+        content = content.replace('&nbsp;', ' ')
+        content = re.sub(pattern, new, content, flags=re.IGNORECASE)
+    return content
+
+
+def best_of(repeat, function):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_point(point, repeat, work_dir):
+    """Time every step for one (strings, languages, template_kb) point; returns {step: seconds}."""
+    languages = language_names(point['languages'])
+    os.makedirs(work_dir)
+    workbook = os.path.join(work_dir, 'copy.xlsx')
+    template_path = os.path.join(work_dir, 'template.html')
+    header_footer_dir = os.path.join(work_dir, 'header_footer')
+    sources = build_workbook(workbook, point['strings'], languages)
+    build_template(template_path, sources, point['template_kb'])
+    build_header_footer(header_footer_dir, languages)
+    images_dir = build_images(work_dir)
+
+    timings = {}
+    timings['extract_columns'], df = best_of(repeat, lambda: extract_columns(workbook, ['FR'] + languages))
+    timings['encode_column'], _ = best_of(repeat, lambda: df.apply(encode_column))
+    timings['language_inputs'], inputs = best_of(
+        repeat, lambda: language_inputs(df, 'FR', languages, header_footer_dir))
+    timings['compile_replacements'], compiled = best_of(
+        repeat, lambda: {language: compile_replacements(inputs[language][0]) for language in languages})
+    with open(template_path, encoding='utf-8') as file:
+        source = file.read()
+    timings['CompiledTemplate'], template = best_of(repeat, lambda: CompiledTemplate(source))
+    timings['render'], pages = best_of(
+        repeat, lambda: {language: template.render(compiled[language]) for language in languages})
+    # Timing a render that substitutes nothing would say nothing about the substitution
+    for language in languages:
+        assert pages[language].count(f"{language} ") >= len(template.text_indices) // 2, \
+            f"the {language} page is barely translated"
+    # One language from scratch, no key pattern compiled yet, must not be slower than the original loop
+    translations = inputs[languages[0]][0]
+    timings['original loop'], _ = best_of(1, lambda: original_replace(source, translations))
+    key_patterns.clear()
+    timings['compile+render (cold)'], _ = best_of(
+        1, lambda: template.render(compile_replacements(translations)))
+    assert timings['compile+render (cold)'] <= timings['original loop'], \
+        "compiling and rendering a language is slower than the original loop"
+    timings['inject_header_footer'], _ = best_of(
+        repeat, lambda: [inject_header_footer(pages[language], inputs[language][1]) for language in languages])
+
+    best = None
+    for _ in range(repeat):
+        run = translate_newsletter(workbook, template_path, header_footer_dir, images_dir, 'FR', languages,
+                                   os.path.join(work_dir, 'run'))
+        total = time.perf_counter() - run['profiler'].started
+        if best is None or total < best[0]:
+            best = (total, run['profiler'])
+    timings['end_to_end'] = best[0]
+    # The stages that only run inside translate_newsletter come from its profiler
+    for row in best[1].rows():
+        if row['stage'] in ('organize', 'zip'):
+            timings[f"{row['stage']} (stage)"] = row['seconds']
+    return timings
+
+
+def scaling(sweep_results, dimension):
+    """Slope of log(seconds) over log(size) between the smallest and largest point of a sweep, per step."""
+    first, last = sweep_results[0], sweep_results[-1]
+    ratio = math.log(last['point'][dimension] / first['point'][dimension])
+    slopes = {}
+    for step, seconds in last['timings'].items():
+        if first['timings'].get(step) and seconds:
+            slopes[step] = round(math.log(seconds / first['timings'][step]) / ratio, 2)
+    return slopes
+
+
+def git_commit():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+
+def print_report(results):
+    for dimension, sweep_results in results['sweeps'].items():
+        steps = list(sweep_results[0]['timings'])
+        print(f"\nVarying {dimension} (others at {results['base']}):")
+        sizes = ''.join(f"{dimension + '=' + str(r['point'][dimension]):>18}" for r in sweep_results)
+        print(f"{'step':<24}{sizes}{'scaling':>10}")
+        slopes = results['scaling'][dimension]
+        for step in steps:
+            cells = ''.join(f"{r['timings'].get(step, float('nan')) * 1000:>15.1f} ms" for r in sweep_results)
+            print(f"{step:<24}{cells}{slopes.get(step, float('nan')):>10.2f}")
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding='utf-8') as file:
+        old = json.load(file)
+    with open(new_path, encoding='utf-8') as file:
+        new = json.load(file)
+    print(f"{old['commit']} -> {new['commit']} (ratio < 1 is faster)")
+    for dimension, new_results in new['sweeps'].items():
+        old_results = {json.dumps(r['point'], sort_keys=True): r for r in old['sweeps'].get(dimension, [])}
+        for result in new_results:
+            previous = old_results.get(json.dumps(result['point'], sort_keys=True))
+            if previous is None:
+                continue
+            print(f"\n{dimension}={result['point'][dimension]}:")
+            for step, seconds in result['timings'].items():
+                if previous['timings'].get(step):
+                    print(f"  {step:<24}{previous['timings'][step] * 1000:>10.1f} ms {seconds * 1000:>10.1f} ms"
+                          f"{seconds / previous['timings'][step]:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, for a fast sanity check")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Where to save the results (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved results and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # The pipeline's progress messages would swamp the report
+    logging.basicConfig(level=logging.ERROR)
+    # pipeline imports pandas lazily; import it now so the first timing does not include it
+    importlib.import_module('pandas')
+    base, sweeps = (QUICK_BASE, QUICK_SWEEPS) if args.quick else (BASE, SWEEPS)
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+               'quick': args.quick, 'repeat': args.repeat, 'base': base, 'sweeps': {}, 'scaling': {}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dimension, sizes in sweeps.items():
+            results['sweeps'][dimension] = []
+            for size in sizes:
+                point = dict(base, **{dimension: size})
+                work_dir = os.path.join(tmp, f"{dimension}-{size}")
+                timings = run_point(point, args.repeat, work_dir)
+                results['sweeps'][dimension].append({'point': point, 'timings': timings})
+            results['scaling'][dimension] = scaling(results['sweeps'][dimension], dimension)
+
+    print_report(results)
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}{'-quick' if args.quick else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# Bump when a change to rendering makes earlier cached pages stale
+CACHE_VERSION = 1
+
+
+def render_key(template_source, translations, header_footer_content=None):
+    """Hash everything a rendered language page depends on."""
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION}\0".encode())
+    digest.update(template_source.encode('utf-8'))
+    digest.update(b"\0")
+    # Insertion order is kept, it decides between overlapping keys of equal length
+    digest.update(json.dumps(list(translations.items()), ensure_ascii=False).encode('utf-8'))
+    digest.update(b"\0")
+    digest.update((header_footer_content or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    On-disk SQLite cache of rendered language pages, keyed by render_key().
+
+    Each entry holds the translated page and, if a header and footer were
+    injected, the final page. When the total size grows past max_bytes the
+    least recently used entries are evicted. Hit and miss counts are kept in
+    the database so they add up across runs.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS renders ("
+                "key TEXT PRIMARY KEY, html TEXT NOT NULL, output TEXT, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.connection.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+
+    def get(self, key):
+        """Return (html, output) for key, or None on a miss."""
+        row = self.connection.execute("SELECT html, output FROM renders WHERE key = ?", (key,)).fetchone()
+        with self.connection:
+            if row is None:
+                self.connection.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+            self.connection.execute("UPDATE renders SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.connection.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+        return row
+
+    def put(self, key, html, output=None):
+        size = len(html.encode('utf-8')) + len((output or '').encode('utf-8'))
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO renders VALUES (?, ?, ?, ?, ?)",
+                                    (key, html, output, size, time.time()))
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        with self.connection:
+            for key, size in self.connection.execute("SELECT key, size FROM renders ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.connection.execute("DELETE FROM renders WHERE key = ?", (key,))
+                total -= size
+
+    def stats(self):
+        counts = dict(self.connection.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM renders").fetchone()
+        return {'hits': counts['hits'], 'misses': counts['misses'], 'entries': entries, 'bytes': size}
+
+    def close(self):
+        self.connection.close()
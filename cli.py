@@ -0,0 +1,144 @@
+"""
+Translate a newsletter from the command line, without Streamlit.
+
+    python cli.py copy.xlsx template.html --header-footer header_footer.zip \
+        --images images.zip --base FR --languages-file languages.txt --output out
+
+The translated pages, organised per language, end up in
+<output>/Translated_Files and <output>/Translated_Files.zip. With several
+templates the workbook is read once and every template gets its own folder,
+<output>/Translated_Files/<template>/<language>/. The exit code is 1 if any
+language failed to render.
+"""
+import argparse
+import logging
+import os
+import sys
+
+from cache import RenderCache
+from memory import TranslationMemory
+from pipeline import (extract_zip_entries, is_header_footer_entry, is_image_entry, translate_batch,
+                      translate_incremental, translate_newsletter)
+
+
+def unpack(path, work_dir, name, wanted):
+    # Zips are accepted wherever a folder is, like the uploads of the web app; only the entries used are extracted
+    if path and path.lower().endswith('.zip'):
+        extracted_path = os.path.join(work_dir, 'uploads', name)
+        extract_zip_entries(path, extracted_path, wanted)
+        return extracted_path
+    return path
+
+
+def read_languages(args):
+    languages = list(args.languages or [])
+    if args.languages_file:
+        with open(args.languages_file, 'r', encoding='utf-8') as file:
+            languages.extend(line.strip() for line in file if line.strip())
+    return languages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('workbook', help="Excel workbook with one column per language")
+    parser.add_argument('templates', nargs='+', metavar='template', help="HTML templates in the master language")
+    parser.add_argument('--header-footer', required=True, help="Folder or zip of per-language header/footer pages")
+    parser.add_argument('--images', help="Folder or zip containing the images folder")
+    parser.add_argument('--base', required=True, help="Master language column, e.g. FR")
+    parser.add_argument('--languages', nargs='+', help="Languages to render, e.g. NL DE IT")
+    parser.add_argument('--languages-file', help="Text file with one language per line")
+    parser.add_argument('--output', default='output', help="Working and output directory (default: output)")
+    parser.add_argument('--workers', type=int, default=1, help="Languages rendered in parallel (default: 1)")
+    parser.add_argument('--cache', help="SQLite render cache that reuses unchanged languages, "
+                                          "e.g. render_cache/renders.sqlite")
+    parser.add_argument('--memory', help="SQLite translation memory that records every string and reports how "
+                                           "many were translated before, e.g. render_cache/memory.sqlite")
+    parser.add_argument('--image-mode', choices=['copy', 'hardlink', 'shared'], default='copy')
+    parser.add_argument('--optimize-images', action='store_true', help="Recompress images once with Pillow")
+    parser.add_argument('--max-image-width', type=int, help="Downscale wider images when optimizing")
+    parser.add_argument('--compression-level', type=int, choices=range(10), default=6, metavar='0-9')
+    parser.add_argument('--keep-excel-files', action='store_true', help="Keep per-language Excel files (debug)")
+    parser.add_argument('--no-zip', action='store_true', help="Do not zip the output folder")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only re-render the languages that changed since the last run in --output")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="Log progress; -vv also logs every file")
+    parser.add_argument('--timings', action='store_true', help="Print the time and memory of every stage")
+    parser.add_argument('--timings-json', metavar='PATH', help="Write the stage timings as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    # Only warnings and errors by default
+    levels = [logging.WARNING, logging.INFO, logging.DEBUG]
+    logging.basicConfig(format='%(message)s', level=levels[min(args.verbose, 2)])
+
+    languages = read_languages(args)
+    if not languages:
+        parser.error("no languages given, use --languages or --languages-file")
+    if args.incremental and (len(args.templates) > 1 or args.no_zip):
+        parser.error("--incremental takes a single template and updates the zip, so no --no-zip")
+
+    os.makedirs(args.output, exist_ok=True)
+    header_footer_dir = unpack(args.header_footer, args.output, 'header_footer', is_header_footer_entry)
+    images_dir = unpack(args.images, args.output, 'images', is_image_entry)
+
+    render_cache = RenderCache(args.cache) if args.cache else None
+    memory = TranslationMemory(args.memory) if args.memory else None
+    try:
+        options = dict(workers=args.workers, cache=render_cache, memory=memory, image_mode=args.image_mode,
+                       optimize_images_once=args.optimize_images, max_image_width=args.max_image_width,
+                       compresslevel=args.compression_level, keep_excel_files=args.keep_excel_files)
+        if args.incremental:
+            run = translate_incremental(args.workbook, args.templates[0], header_footer_dir, images_dir, args.base,
+                                        languages, args.output, **options)
+        elif len(args.templates) == 1:
+            # One template keeps the flat layout of the web app
+            run = translate_newsletter(args.workbook, args.templates[0], header_footer_dir, images_dir, args.base,
+                                       languages, args.output, zip_output=not args.no_zip, **options)
+        else:
+            run = translate_batch(args.workbook, args.templates, header_footer_dir, images_dir, args.base,
+                                  languages, args.output, zip_output=not args.no_zip, **options)
+        memory_stats = memory.stats() if memory is not None else None
+    finally:
+        if render_cache is not None:
+            render_cache.close()
+        if memory is not None:
+            memory.close()
+
+    results = run['results']
+    if len(args.templates) == 1:
+        results = {'': results}
+    failed = 0
+    for name, template_results in results.items():
+        for keyword, result in template_results.items():
+            label = f"{name} {keyword}".strip()
+            if isinstance(result, Exception):
+                failed += 1
+                print(f"{label}: failed: {result}", file=sys.stderr)
+            elif result['output_file'] is None:
+                print(f"{label}: no header and footer folder found", file=sys.stderr)
+            else:
+                print(f"{label}: {result['strings']} strings{' (cached)' if result['cached'] else ''}")
+    if run.get('unchanged'):
+        print(f"Unchanged since the last run: {', '.join(run['unchanged'])}")
+    if memory_stats is not None:
+        run_stats = memory_stats['run']
+        print(f"Translation memory: {run_stats['known_strings']}/{run_stats['strings']} strings "
+              f"translated before, {run_stats['patterns_reused']}/"
+              f"{run_stats['patterns_reused'] + run_stats['patterns_compiled']} string patterns reused")
+    if run['zip_path']:
+        print(f"Archive: {run['zip_path']}")
+    elif run['output_dir']:
+        print(f"Output: {run['output_dir']}")
+
+    if args.timings:
+        print(run['profiler'].summary(), file=sys.stderr)
+    if args.timings_json == '-':
+        print(run['profiler'].to_json())
+    elif args.timings_json:
+        with open(args.timings_json, 'w', encoding='utf-8') as file:
+            file.write(run['profiler'].to_json())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
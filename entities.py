@@ -0,0 +1,70 @@
+import re
+from html.entities import codepoint2name, name2codepoint
+
+# Regular expression to identify URLs
+url_pattern = re.compile(
+    r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+# Every character that has a named entity, mapped to that entity
+entity_table = {chr(code): f"&{name};" for code, name in codepoint2name.items()}
+encodable_chars = frozenset(entity_table) - {'&'}
+
+# Joins the cells of a column so they are encoded as one string. It has no
+# entity, so it survives encoding and splits the result back into cells.
+cell_separator = '\x00'
+
+# After encoding an entity that was already in the text shows up with its
+# '&' encoded again, e.g. '&eacute;' becomes '&amp;eacute;'
+double_encoded_pattern = re.compile(r'&amp;([A-Za-z0-9]+);')
+
+
+def restore_entity(match):
+    name = match.group(1)
+    return f"&{name};" if name in name2codepoint else match.group(0)
+
+
+def convert_to_named_entities(text):
+    """Replace every character that has a named HTML entity, keeping existing entities."""
+    # '&' goes first so the entities inserted below are not encoded again
+    text = text.replace('&', '&amp;')
+    # One replace per distinct character actually present in the text
+    for char in encodable_chars.intersection(text):
+        text = text.replace(char, entity_table[char])
+    if '&amp;' in text:
+        text = double_encoded_pattern.sub(restore_entity, text)
+    return text
+
+
+def encode_cell(value):
+    # Only text cells are converted, and URLs are left as is
+    if isinstance(value, str) and not url_pattern.search(value):
+        return convert_to_named_entities(value)
+    return value
+
+
+def encode_column(column):
+    """
+    Entity-encode a whole pandas Series at once, with the same result as encode_cell.
+
+    The text cells are joined and encoded as one string, so each distinct
+    character is replaced in a single pass over the column rather than once
+    per cell.
+    """
+    import pandas as pd
+
+    values = pd.Series(column.to_numpy(dtype=object, copy=True))
+    text = values[values.map(lambda value: isinstance(value, str)).astype(bool)]
+    text = text[~text.str.contains(url_pattern).astype(bool)]
+
+    cells = text.tolist()
+    joined = cell_separator.join(cells)
+    if not cells:
+        encoded = []
+    elif joined.count(cell_separator) == len(cells) - 1:
+        encoded = convert_to_named_entities(joined).split(cell_separator)
+    else:
+        # A cell contains the separator itself, encode cell by cell
+        encoded = [convert_to_named_entities(cell) for cell in cells]
+    values[text.index] = encoded
+
+    return pd.Series(values.to_numpy(), index=column.index, name=column.name)
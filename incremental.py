@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+
+# Bump when the snapshot layout changes; older snapshots then force a full run
+SNAPSHOT_VERSION = 1
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tree_digest(directory):
+    """Hash the relative path and content of every file under directory."""
+    # Contents rather than modification times, so a re-extracted upload still matches
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            digest.update(f"{os.path.relpath(path, directory)}\0{file_digest(path)}\n".encode())
+    return digest.hexdigest()
+
+
+def snapshot_frame(df):
+    """
+    The extracted columns in the form they are kept and compared between runs.
+
+    Every cell becomes its text, as the translation dicts see it, with
+    missing cells kept as missing. The sheet row numbers are dropped, so only
+    a change of content or order counts as a change.
+    """
+    import pandas as pd
+
+    return pd.DataFrame({column: df[column].map(lambda value: None if pd.isna(value) else str(value))
+                         .astype('string').reset_index(drop=True) for column in df.columns})
+
+
+def save_snapshot(directory, df, state):
+    """Write the extracted columns as snapshot.parquet and the run's state as snapshot.json."""
+    snapshot_frame(df).to_parquet(os.path.join(directory, 'snapshot.parquet'), index=False)
+    # The state goes last, a run interrupted before it leaves no usable snapshot
+    with open(os.path.join(directory, 'snapshot.json'), 'w', encoding='utf-8') as file:
+        json.dump(dict(state, version=SNAPSHOT_VERSION), file)
+
+
+def remove_snapshot(directory):
+    """Delete the snapshot saved in directory, for a run that rewrites the output without saving a new one."""
+    # The state first, without it the columns are never used
+    for name in ('snapshot.json', 'snapshot.parquet'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_snapshot(directory):
+    """Return (columns, state) of the last run saved in directory, or None."""
+    import pandas as pd
+
+    state_path = os.path.join(directory, 'snapshot.json')
+    columns_path = os.path.join(directory, 'snapshot.parquet')
+    if not (os.path.exists(state_path) and os.path.exists(columns_path)):
+        return None
+    with open(state_path, 'r', encoding='utf-8') as file:
+        state = json.load(file)
+    if state.get('version') != SNAPSHOT_VERSION:
+        return None
+    return pd.read_parquet(columns_path), state
+
+
+def changed_columns(previous, current, base_keyword, keywords):
+    """
+    Return the keywords whose column differs between two snapshot frames.
+
+    A change in the base column changes every language. A column missing
+    from either frame counts as changed.
+    """
+    def same(column):
+        return column in previous.columns and column in current.columns and previous[column].equals(current[column])
+
+    if not same(base_keyword):
+        return list(keywords)
+    return [keyword for keyword in keywords if not same(keyword)]
@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def rss_mb():
+    """Resident set size of this process right now, in MB, or None where it is unknown (it is read from /proc)."""
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """
+    Highest resident set size this process reached since it started, in MB,
+    or None where it is unknown. Only telling for a process that does one job.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def highest(*values):
+    known = [value for value in values if value is not None]
+    return max(known) if known else None
+
+
+class Profiler:
+    """
+    Wall time, resident memory and work counters for each stage of a run.
+
+    A stage is timed with ``with profiler.stage('zip') as stats:`` and the
+    block adds to stats['rows'], stats['strings'] and stats['bytes']. Timing
+    a stage again adds to its totals. Work timed inside worker processes is
+    added with add(), so for those stages the seconds are summed over jobs.
+
+    rss_mb is the highest resident set size sampled when the stage started
+    and ended, or when a job added to it finished, in the process that ran
+    it. Memory used and released within a stage is not seen.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def record(self, name):
+        return self.stages.setdefault(name, {'seconds': 0.0, 'rss_mb': None, 'rows': 0, 'strings': 0, 'bytes': 0})
+
+    @contextmanager
+    def stage(self, name):
+        stats = self.record(name)
+        stats['rss_mb'] = highest(stats['rss_mb'], rss_mb())
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats['seconds'] += time.perf_counter() - start
+            stats['rss_mb'] = highest(stats['rss_mb'], rss_mb())
+
+    def add(self, name, seconds=0.0, rss=None, **counts):
+        """Add work done elsewhere; rss is the RSS in MB sampled where it ran, this process's by default."""
+        stats = self.record(name)
+        stats['seconds'] += seconds
+        for counter, value in counts.items():
+            stats[counter] += value
+        stats['rss_mb'] = highest(stats['rss_mb'], rss if rss is not None else rss_mb())
+
+    def rows(self):
+        """One dict per stage, in the order the stages first ran."""
+        return [{'stage': name, 'seconds': round(stats['seconds'], 4),
+                 'rss_mb': None if stats['rss_mb'] is None else round(stats['rss_mb'], 1),
+                 'rows': stats['rows'], 'strings': stats['strings'], 'bytes': stats['bytes']}
+                for name, stats in self.stages.items()]
+
+    def to_json(self):
+        rss = highest(*(stats['rss_mb'] for stats in self.stages.values()))
+        return json.dumps({'total_seconds': round(time.perf_counter() - self.started, 4),
+                           'rss_mb': None if rss is None else round(rss, 1), 'stages': self.rows()}, indent=2)
+
+    def summary(self):
+        """The stages as a plain text table."""
+        lines = [f"{'stage':<10} {'seconds':>9} {'RSS MB':>9} {'rows':>8} {'strings':>9} {'bytes':>12}"]
+        for row in self.rows():
+            rss = '-' if row['rss_mb'] is None else f"{row['rss_mb']:.1f}"
+            lines.append(f"{row['stage']:<10} {row['seconds']:>9.3f} {rss:>9} {row['rows']:>8} "
+                         f"{row['strings']:>9} {row['bytes']:>12}")
+        lines.append(f"{'total':<10} {time.perf_counter() - self.started:>9.3f}")
+        return '\n'.join(lines)
@@ -0,0 +1,43 @@
+import threading
+import time
+
+
+class BackgroundJob:
+    """
+    Run a function in a daemon thread and keep what it reports along the way.
+
+    The function is called with ``progress=job.report`` on top of the given
+    arguments. Every report(key, value) is appended to ``updates``, which the
+    caller can read at any time, e.g. from a Streamlit fragment that polls it.
+    Once ``done`` is true ``result`` holds the return value, or ``error`` the
+    exception that stopped the function.
+    """
+
+    def __init__(self, target, *args, **kwargs):
+        self.updates = []
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.thread = threading.Thread(target=self._run, args=(target, args, kwargs), daemon=True)
+        self.thread.start()
+
+    def _run(self, target, args, kwargs):
+        try:
+            self.result = target(*args, progress=self.report, **kwargs)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = time.time()
+
+    def report(self, key, value):
+        # list.append is atomic, so the reading thread never sees a partial update
+        self.updates.append((key, value))
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
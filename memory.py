@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import time
+
+# Sources looked up per query, below SQLite's limit on bound parameters
+LOOKUP_BATCH = 500
+
+
+class TranslationMemory:
+    """
+    Persistent SQLite translation memory shared by every run.
+
+    It keeps each language's normalised source strings with their latest
+    translation, so a run can tell how much of its copy was translated
+    before. It also counts the key patterns the renders reused and compiled:
+    matchers are built key by key, and a key's pattern is compiled once per
+    process, so a repeated workbook compiles little. A compiled pattern
+    cannot be stored, so that reuse lasts as long as the process, not the
+    store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.run_stats = {'strings': 0, 'known_strings': 0, 'patterns_reused': 0, 'patterns_compiled': 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS strings (language TEXT NOT NULL, source TEXT NOT NULL, "
+                "target TEXT NOT NULL, runs INTEGER NOT NULL, last_seen REAL NOT NULL, PRIMARY KEY (language, source))")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.connection.execute("INSERT OR IGNORE INTO stats VALUES ('strings', 0), ('known_strings', 0), "
+                                    "('patterns_reused', 0), ('patterns_compiled', 0)")
+
+    def remember(self, language, translations):
+        """Store a language's (source, target) pairs and return how many were already known unchanged."""
+        sources = list(translations)
+        known = 0
+        # Only the sources of this run are looked up, through the primary key
+        for start in range(0, len(sources), LOOKUP_BATCH):
+            batch = sources[start:start + LOOKUP_BATCH]
+            rows = self.connection.execute(
+                f"SELECT source, target FROM strings WHERE language = ? AND source IN ({', '.join('?' * len(batch))})",
+                [language] + batch)
+            known += sum(1 for source, target in rows if translations[source] == target)
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO strings VALUES (?, ?, ?, 1, ?) ON CONFLICT (language, source) DO UPDATE SET "
+                "target = excluded.target, runs = runs + 1, last_seen = excluded.last_seen",
+                ((language, source, target, now) for source, target in translations.items()))
+        self.count(strings=len(translations), known_strings=known)
+        return known
+
+    def count(self, **counts):
+        with self.connection:
+            for name, value in counts.items():
+                self.run_stats[name] += value
+                self.connection.execute("UPDATE stats SET value = value + ? WHERE name = ?", (value, name))
+
+    def stats(self):
+        """This instance's counts under 'run', the counts of every run under 'all', and the strings stored."""
+        totals = dict(self.connection.execute("SELECT name, value FROM stats").fetchall())
+        strings = self.connection.execute("SELECT COUNT(*) FROM strings").fetchone()[0]
+        return {'run': dict(self.run_stats), 'all': totals, 'stored_strings': strings}
+
+    def close(self):
+        self.connection.close()
@@ -1,362 +1,15 @@
 import os
-from openpyxl import load_workbook
-from bs4 import BeautifulSoup
-import html
-import re
-import pandas as pd
-from itertools import combinations
-# import concurrent.futures
-import openpyxl
-from html.entities import codepoint2name, name2codepoint
-import shutil
+import hashlib
+import tempfile
+from io import BytesIO
 from pathlib import Path
-from zipfile import ZipFile
 import streamlit as st
-import base64
-
-def read_html_file(html_file_path):
-    with open(html_file_path, 'r', encoding='utf-8') as file:
-        html_content = file.read()
-    return html_content
-
-def excel_to_markdown_table(excel_path):
-    print(f"Converting {excel_path} to markdown table format")
-    wb = load_workbook(excel_path)
-    markdown_tables = ""
-    
-    for sheet_name in wb.sheetnames:
-        sheet = wb[sheet_name]
-        markdown_tables += f"### Sheet: {sheet_name}\n\n"
-        rows = list(sheet.iter_rows(values_only=True))
-        
-        if rows:
-            # Create rows ignoring the first row (headers)
-            for row in rows[1:]:
-                row_data = []
-                for cell in row:
-                    if cell is not None:
-                        cell_text = str(cell).strip()  # Remove leading and trailing spaces
-                        cell_text = re.sub(r'\s+', ' ', cell_text)  # Replace multiple spaces with a single space
-                    else:
-                        cell_text = ""
-                    row_data.append(cell_text)
-                markdown_tables += " : ".join(row_data) + " \n"
-            markdown_tables += "\n"
-    print(markdown_tables)
-    return markdown_tables
-
-def convert_to_dict(input_str):
-    print("Converting French translation to dict")
-    lines = [line.strip() for line in input_str.split("\n") if line.strip()]
-    output_dict = {}
-    for line in lines:
-        if " : " in line:
-            key, value = line.split(" : ", 1)
-            key = ' '.join(key.split())  # Remove excessive spaces
-            value = ' '.join(value.split())  # Remove excessive spaces
-            output_dict[key] = value
-    print(output_dict)
-    return output_dict
-
-
-def replace_text_in_html(input_file, output_file, replacements):
-    def create_pattern(text):
-        # Escape the text and allow for &nbsp; in addition to regular spaces and HTML tags
-        text = re.escape(text)
-        # Replace escaped spaces with regex pattern for spaces, &nbsp;, and any HTML tags
-        text = text.replace(r'\ ', r'(\s*|&nbsp;)')
-        return text
-
-    with open(input_file, 'r', encoding='utf-8') as file:
-        content = file.read()
-    
-    # Sort replacements by the length of the old text in descending order
-    sorted_replacements = dict(sorted(replacements.items(), key=lambda item: len(item[0]), reverse=True))
-    
-    # Replace text in the HTML content (case-insensitive, space-ignoring, ignoring any HTML tags)
-    for old, new in sorted_replacements.items():
-        pattern = create_pattern(old)
-        # Replace &nbsp; with regular space in content before applying regex substitution
-        content = content.replace('&nbsp;', ' ')
-        content = re.sub(pattern, new, content, flags=re.IGNORECASE)
-    
-    # Write the updated content to a new file
-    with open(output_file, 'w', encoding='utf-8') as file:
-        file.write(content)
-
-
-def extract_columns(file_path, keywords, header_search_rows=10):
-    xls = pd.ExcelFile(file_path)
-    all_columns = pd.DataFrame()
-    seen_columns = set()
-
-    print(f"Sheets found: {xls.sheet_names}")
-
-    for sheet_name in xls.sheet_names:
-        if sheet_name == "BALISES":
-            print(f"Skipping sheet: {sheet_name}")
-            continue
-        
-        print(f"Processing sheet: {sheet_name}")
-        
-        df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-
-        column_row_index = None
-        for i in range(header_search_rows):
-            if df.iloc[i].astype(str).str.contains('|'.join(keywords)).any():
-                column_row_index = i
-                break
-
-        if column_row_index is None:
-            print(f"No column names found within the first {header_search_rows} rows in sheet {sheet_name}")
-            continue
-        
-        df.columns = df.iloc[column_row_index].str.strip()
-        df = df[column_row_index + 1:]
-
-        print(f"Columns in {sheet_name} (identified row {column_row_index}): {df.columns.tolist()}")
-
-        for col in df.columns:
-            if isinstance(col, str):
-                for keyword in keywords:
-                    if col.startswith(keyword) and col not in seen_columns:
-                        print(f"Matched column: {col}")
-                        all_columns[col] = df[col]
-                        seen_columns.add(col)
-                        break
-
-    return all_columns
-
-
-def create_combinations(df, base_keyword, combination_keywords):
-    output_folder = 'processed_excel_files'
-    os.makedirs(output_folder, exist_ok=True)
-    
-    for keyword in combination_keywords:
-        if base_keyword in df.columns and keyword in df.columns:
-            combined_df = df[[base_keyword, keyword]]
-            output_file = os.path.join(output_folder, f'{keyword}.xlsx')
-            combined_df.to_excel(output_file, index=False)
-            print(f"Created file: {output_file}")
-
-
-# Regular expression to identify URLs
-url_pattern = re.compile(
-    r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-
-def is_named_entity(text, i):
-    if text[i] == '&':
-        semicolon_index = text.find(';', i)
-        if semicolon_index != -1:
-            entity_candidate = text[i:semicolon_index + 1]
-            if entity_candidate[1:-1] in name2codepoint:
-                return True
-    return False
-
-def convert_to_named_entities(text):
-    result = []
-    i = 0
-    while i < len(text):
-        if is_named_entity(text, i):
-            semicolon_index = text.find(';', i)
-            entity_candidate = text[i:semicolon_index + 1]
-            result.append(entity_candidate)
-            i = semicolon_index + 1
-        else:
-            code = ord(text[i])
-            if code in codepoint2name:
-                entity = f"&{codepoint2name[code]};"
-                result.append(entity)
-            else:
-                result.append(text[i])
-            i += 1
-    return ''.join(result)
-
-def process_excel_file(input_file):
-    try:
-        # Load the Excel workbook
-        wb = openpyxl.load_workbook(input_file, data_only=True)
-        print(f"Processing file: {input_file}")
-        
-        # Iterate through each sheet
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            print(f"Processing sheet: {sheet_name}")
-            
-            # Iterate through each row and cell
-            for row in ws.iter_rows():
-                for cell in row:
-                    try:
-                        # Process only text cells
-                        if isinstance(cell.value, str):
-                            original_value = cell.value
-                            # Skip URL processing
-                            if not url_pattern.search(original_value):
-                                cell.value = convert_to_named_entities(cell.value)
-                            print(f"Original value in cell {cell.coordinate}: {original_value}")
-                            print(f"Converted value in cell {cell.coordinate}: {cell.value}")
-                    except Exception as e:
-                        print(f"Error processing cell {cell.coordinate}: {e}")
-        
-        # Save the modified workbook with the same name
-        wb.save(input_file)
-        print(f"Workbook saved to {input_file}")
-    except Exception as e:
-        print(f"Failed to process file {input_file}: {e}")
-
-# Iterate over all Excel files in the directory
-
-def process_folder(folder_path, html_template_path):
-    html_content = read_html_file(html_template_path)
-    
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith(".xlsx"):
-            excel_file_path = os.path.join(folder_path, file_name)
-            wb = load_workbook(excel_file_path, read_only=True)
-            
-            for sheet_name in wb.sheetnames:
-                excel_text = excel_to_markdown_table(excel_file_path)
-                excel_to_dict=convert_to_dict(excel_text)
-                # french_html = extract_french_html(html_content, excel_text)
-                # french = extract_french_translation(excel_text)
-                html_folder_path = 'html'
-                output_html_file = os.path.join(html_folder_path, f"{os.path.splitext(file_name)[0]}.html")
-                replace_text_in_html(html_template_path, output_html_file,excel_to_dict)
-                print(f"Processed {file_name} - {sheet_name}")
-
-
-
-def extract_content(file_content, start_comment, end_comment):
-    """Extract content between the specified start and end comments."""
-    pattern = re.compile(f'{re.escape(start_comment)}(.*?){re.escape(end_comment)}', re.DOTALL)
-    match = pattern.search(file_content)
-    extracted_content = match.group(1) if match else ''
-    return extracted_content
-
-def replace_content(file_content, new_content, start_comment, end_comment):
-    """Replace content between the specified start and end comments with new content."""
-    pattern = re.compile(f'({re.escape(start_comment)}).*?({re.escape(end_comment)})', re.DOTALL)
-    updated_content = pattern.sub(f'\\1{new_content}\\2', file_content)
-    return updated_content
-
-def main(header_footer_dir, html_dir, output_dir):
-    if not os.path.exists(header_footer_dir):
-        print(f"Error: The directory '{header_footer_dir}' does not exist.")
-        return
-    if not os.path.exists(html_dir):
-        print(f"Error: The directory '{html_dir}' does not exist.")
-        return
-    
-    # Iterate over subdirectories within the header_footer_dir
-    for root, dirs, files in os.walk(header_footer_dir):
-        for subdir in dirs:
-            header_footer_folder = os.path.join(root, subdir)
-            if os.path.isdir(header_footer_folder):
-                # Construct the corresponding HTML filename
-                normalized_subdir = subdir.replace('_', ' ').replace(' ', '')
-                found_html_filename = None
-                
-                # Search for a matching HTML file ignoring extra spaces
-                for html_file in os.listdir(html_dir):
-                    normalized_html_file = html_file.replace(' ', '')
-                    if normalized_html_file == normalized_subdir + '.html':
-                        found_html_filename = html_file
-                        break
-                
-                if found_html_filename:
-                    html_filepath = os.path.join(html_dir, found_html_filename)
-                    index_filepath = os.path.join(header_footer_folder, 'index.html')
-                    if os.path.exists(index_filepath):
-                        with open(index_filepath, 'r', encoding='utf-8') as file:
-                            file1_content = file.read()
-                        
-                        with open(html_filepath, 'r', encoding='utf-8') as file:
-                            file2_content = file.read()
-
-                        # Extract content from index.html
-                        header_content = extract_content(file1_content, '<!--Header Code Start-->', '<!--Header Code End-->')
-                        footer_content = extract_content(file1_content, '<!--Footer Code Start-->', '<!--Footer Code End-->')
-
-                        # Replace content in the HTML file
-                        updated_file2_content = replace_content(file2_content, header_content, '<!--Header Code Start-->', '<!--Header Code End-->')
-                        updated_file2_content = replace_content(updated_file2_content, footer_content, '<!--Footer Code Start-->', '<!--Footer Code End-->')
-
-                        # Write the updated content to the output directory
-                        output_filepath = os.path.join(output_dir, found_html_filename)
-                        os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
-
-                        # Debugging output
-                        print(f"Writing to {output_filepath}")
-
-                        with open(output_filepath, 'w', encoding='utf-8') as file:
-                            file.write(updated_file2_content)
-                        print(f"Updated content written to {output_filepath}")
-                    else:
-                        print(f"Warning: 'index.html' not found in {header_footer_folder}.")
-                else:
-                    print(f"Warning: Corresponding HTML file for folder '{subdir}' not found in {html_dir}.")
-
-
-def get_immediate_images_directory(images_directory):
-    for root, dirs, files in os.walk(images_directory):
-        # Check if the current directory has image files directly within it
-        if any(file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')) for file in files):
-            return root
-    return None
-
-def normalize_name(name):
-    # Normalize the name by removing spaces and converting to lowercase
-    return name.replace(" ", "").lower()
-
-def organize_html_files(directory_path, images_directory):
-    # Ensure the directories exist
-    if not os.path.exists(directory_path):
-        print(f"Directory '{directory_path}' does not exist.")
-        return None
-    if not os.path.exists(images_directory):
-        print(f"Images directory '{images_directory}' does not exist.")
-        return None
-
-    immediate_images_directory = get_immediate_images_directory(images_directory)
-    if not immediate_images_directory:
-        print(f"No immediate directory containing images found in '{images_directory}'.")
-        return None
-
-    # Normalize the name of the immediate images directory for comparison
-    normalized_immediate_images_directory = normalize_name(os.path.basename(immediate_images_directory))
-
-    # Iterate through files in the directory
-    for filename in os.listdir(directory_path):
-        if filename.endswith(".html"):
-            file_path = os.path.join(directory_path, filename)
-
-            # Normalize the filename for comparison
-            normalized_filename = normalize_name(os.path.splitext(filename)[0])
-            
-            # Check if there is a corresponding directory name that matches the normalized filename
-            matching_directories = [
-                d for d in os.listdir(directory_path)
-                if os.path.isdir(os.path.join(directory_path, d)) and normalize_name(d) == normalized_filename
-            ]
-
-            if matching_directories:
-                # Use the first matching directory
-                new_directory = os.path.join(directory_path, matching_directories[0])
-            else:
-                # Create a directory with the normalized filename if no match is found
-                new_directory = os.path.join(directory_path, normalized_filename)
-                os.makedirs(new_directory, exist_ok=True)
-
-            # Move the HTML file into the new directory
-            shutil.move(file_path, new_directory)
-
-            # Copy the immediate 'Images' directory into the new directory
-            new_images_directory = os.path.join(new_directory, "images")
-            shutil.copytree(immediate_images_directory, new_images_directory, symlinks=True)
-
-            print(f"Moved '{filename}' and copied images from '{immediate_images_directory}' to '{new_directory}'.")
-
-    return directory_path  # Return the organized files directory
+from cache import RenderCache
+from memory import TranslationMemory
+from jobs import BackgroundJob
+from pipeline import (extract_zip_entries, is_header_footer_entry, is_image_entry, recreate_directory,
+                      translate_batch, translate_incremental, translate_newsletter, zip_images,
+                      zip_language)
 
 # Create a file uploader widget
 
@@ -367,82 +20,72 @@ st.title("Upload Directories and Files")
 
 
 
-# Function to upload and extract zip file
-def upload_and_extract_zip(label):
-    uploaded_file = st.file_uploader(label, type="zip")
-    if uploaded_file:
-        zip_path = Path(uploaded_file.name)
-        with open(zip_path, 'wb') as f:
-            f.write(uploaded_file.read())
-        
-        # Extract zip file
-        extracted_path = Path(label.replace(" ", "_").replace(".zip", ""))
-        with ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extracted_path)
-        
-        return extracted_path
-    return None
-
-# Function to upload a single file
-def upload_file(label, file_types):
-    uploaded_file = st.file_uploader(label, type=file_types)
-    if uploaded_file:
-        file_path = Path(uploaded_file.name)
-        with open(file_path, 'wb') as f:
-            f.write(uploaded_file.read())
-        return file_path
-    return None
-
-def remove_dir(directory_path):
+def session_workspace():
     """
-    Removes a directory and all its contents.
+    Return this browser session's private working directory.
 
-    :param directory_path: Path to the directory to be removed.
+    Every upload and output of the session lives under it, so concurrent
+    users never touch each other's files. The TemporaryDirectory is kept in
+    session state and removes itself once the session ends and its state is
+    garbage collected.
     """
-    if os.path.exists(directory_path):
-        shutil.rmtree(directory_path)
-        print(f"Directory '{directory_path}' has been removed.")
-    else:
-        print(f"Directory '{directory_path}' does not exist.")
-def clear_directory(directory_path):
+    if 'workspace' not in st.session_state:
+        st.session_state.workspace = tempfile.TemporaryDirectory(prefix='newsletter_')
+    return Path(st.session_state.workspace.name)
+
+def upload_digest(uploaded_file):
+    # Hash each upload once; reruns with the same upload reuse the digest
+    digests = st.session_state.setdefault('upload_digests', {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    return digests[uploaded_file.file_id]
+
+def memoized_upload(key, create):
+    # Uploads live in the session workspace, so they are memoized per session
+    uploads = st.session_state.setdefault('uploads', {})
+    if key not in uploads or not uploads[key].exists():
+        uploads[key] = create()
+    return uploads[key]
+
+def store_upload(digest, name, uploaded_file):
+    """Write an upload under uploads/<digest>/ of the workspace once per distinct content."""
+    def create():
+        file_path = session_workspace() / 'uploads' / digest / name
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(uploaded_file.getbuffer())
+        return file_path
+    return memoized_upload((digest, name), create)
+
+def extract_upload(digest, label, uploaded_file, wanted):
     """
-    Clears all files and subdirectories within the specified directory.
+    Extract the entries of a zip upload that the pipeline uses, once per distinct content.
 
-    Parameters:
-    directory_path (str): The path to the directory to be cleared.
+    The zip is read from memory through its central directory, it is never
+    written to disk itself.
     """
-    # Check if the directory exists
-    if os.path.exists(directory_path):
-        # Iterate over all the files and directories within the specified directory
-        for item in os.listdir(directory_path):
-            item_path = os.path.join(directory_path, item)
-            # If it's a directory, remove it and its contents
-            if os.path.isdir(item_path):
-                shutil.rmtree(item_path)
-            # If it's a file, remove it
-            elif os.path.isfile(item_path) or os.path.islink(item_path):
-                os.unlink(item_path)
-    else:
-        print(f"The directory {directory_path} does not exist.")
+    def create():
+        extracted_path = session_workspace() / 'uploads' / digest / label.replace(" ", "_").replace(".zip", "")
+        with st.spinner("Extracting zip file..."):
+            extract_zip_entries(uploaded_file, extracted_path, wanted)
+        return extracted_path
+    return memoized_upload((digest, label), create)
 
+# Function to upload a zip file and extract what wanted(name) accepts
+def upload_and_extract_zip(label, wanted):
+    uploaded_file = st.file_uploader(label, type="zip")
+    if uploaded_file:
+        return extract_upload(upload_digest(uploaded_file), label, uploaded_file, wanted)
+    return None
 
-def recreate_directory(directory):
-    """
-    Recreates the specified directory. If it already exists, it is removed first.
-    
-    Args:
-    - directory (str): The path of the directory to recreate.
-    """
-    if os.path.exists(directory):
-        shutil.rmtree(directory)  # Remove the directory and its contents
-        print(f"Directory removed: {directory}")
-    
-    os.makedirs(directory)  # Recreate the directory
-    print(f"Directory created: {directory}")
+# Function to upload several files at once
+def upload_files(label, file_types):
+    uploaded_files = st.file_uploader(label, type=file_types, accept_multiple_files=True)
+    return [store_upload(upload_digest(uploaded_file), uploaded_file.name, uploaded_file)
+            for uploaded_file in uploaded_files or []]
 
-# Define the path to the input Excel file
-input_excel_file_path = upload_file("Upload Excel File", ["xlsx"])
-output_file=input_excel_file_path
+# The workbook stays in memory, the parsers read it from the upload's bytes
+input_excel_file = st.file_uploader("Upload Excel File", type=["xlsx"])
+output_file=input_excel_file
 # output_file='final_encoded_excel_file.xlsx'
 # if input_excel_file_path is not None:
 #     html_encoded_excel = convert_excel_text_to_html_entities(input_excel_file_path, output_file)
@@ -451,22 +94,12 @@ output_file=input_excel_file_path
 # Keywords to search for in column headers
 # keywords = ['FR','NO']
 # keywords=['FR','SE']
-# Process the generated Excel files in the output folder
-output_folder_path = 'processed_excel_files'
-recreate_directory(output_folder_path)
-# remove_dir(output_folder_path)
-
-html_template_path = upload_file("Upload HTML Template File", ["html"])
-header_footer_dir = upload_and_extract_zip("Header and Footer")
-html_dir = 'html'
-recreate_directory(html_dir)
-# remove_dir(html_dir)
-
-output_dir = 'Translated_Files'
-recreate_directory(output_dir)
-# remove_dir(output_dir)
-
-images_dir = upload_and_extract_zip("images")
+
+# Several templates are translated as one batch that reads the workbook once
+html_template_paths = upload_files("Upload HTML Template Files", ["html"])
+header_footer_dir = upload_and_extract_zip("Header and Footer", is_header_footer_entry)
+
+images_dir = upload_and_extract_zip("images", is_image_entry)
 base_keyword=st.text_input('Enter your Master Language (e.g., "FR")', '')
 # combination_keywords = [keyword for keyword in keywords if keyword != base_keyword]
 
@@ -490,78 +123,212 @@ if uploaded_file:
 else:
     st.write('Please upload a text file with keywords.')
 
+keep_excel_files = st.checkbox("Keep per-language Excel files (debug)", value=False)
+incremental = st.checkbox("Only re-render languages that changed since the last run", value=False,
+                          help="Compares the workbook with the one processed last in this session. "
+                               "Works with a single template.")
+use_render_cache = st.checkbox("Reuse unchanged languages from the render cache", value=True)
+use_memory = st.checkbox("Use the translation memory", value=True,
+                         help="Remembers every string translated, to report how much of the copy was "
+                              "translated before, and how many string patterns were reused rather than "
+                              "compiled. Patterns are kept until the app restarts.")
+image_modes = {
+    "Copy into every language folder": 'copy',
+    "Hard-link into every language folder (same layout, less disk)": 'hardlink',
+    "One shared images folder (smallest download)": 'shared',
+}
+image_mode = image_modes[st.selectbox("Images in the download", list(image_modes))]
+optimize_images_once = st.checkbox("Recompress images once with Pillow", value=False)
+max_image_width = st.number_input("Maximum image width in pixels (0 keeps the original size)", min_value=0, value=0,
+                                  disabled=not optimize_images_once)
+compression_level = st.slider("Zip compression level", min_value=0, max_value=9, value=6,
+                              help="Images are always stored as they are; this only affects HTML and other text.")
+workers = st.number_input("Parallel workers", min_value=1, max_value=os.cpu_count() or 1,
+                          value=min(4, os.cpu_count() or 1))
+
+def run_pipeline(workspace, workbook, html_template_paths, header_footer_dir, images_dir, base_keyword, languages,
+                 use_render_cache, use_memory, incremental, options, progress):
+    """
+    The Process job, run by a BackgroundJob outside the script run.
+
+    Each language is zipped on its own as soon as it is rendered, so it can be
+    downloaded before the others are done. The images are those the final
+    archive gets, recompressed first if asked. With shared images they are
+    zipped once, before any language, and the language zips hold only the page.
+    Returns the run, its results keyed
+    by a readable label and the render cache and translation memory statistics.
+    """
+    languages_dir = workspace / 'languages'
+    recreate_directory(languages_dir)
+    prepared = {'images_dir': images_dir}
+
+    def images_ready(run_images_dir):
+        # Called by the pipeline before rendering, with the images as they go in the final archive
+        prepared['images_dir'] = run_images_dir
+        if options['image_mode'] == 'shared' and run_images_dir:
+            zip_images(run_images_dir, languages_dir / 'images.zip')
+
+    def language_done(key, result):
+        # A batch reports (template, language) pairs
+        label = ' '.join(key) if isinstance(key, tuple) else key
+        download = None
+        if isinstance(result, dict) and result['output_file']:
+            download = zip_language(result['output_file'], prepared['images_dir'],
+                                    languages_dir / f"{label.replace(' ', '_')}.zip", options['compresslevel'],
+                                    options['image_mode'])
+        progress(label, {'result': result, 'download': download})
+
+    # SQLite connections belong to the thread that opens them, so the cache and memory are opened here
+    render_cache = RenderCache(os.path.join('render_cache', 'renders.sqlite')) if use_render_cache else None
+    memory = TranslationMemory(os.path.join('render_cache', 'memory.sqlite')) if use_memory else None
+    options = dict(options, cache=render_cache, memory=memory)
+    try:
+        if len(html_template_paths) == 1:
+            translate = translate_incremental if incremental else translate_newsletter
+            run = translate(workbook, html_template_paths[0], header_footer_dir, images_dir, base_keyword, languages,
+                            workspace, progress=language_done, images_ready=images_ready, **options)
+            results = run['results']
+        else:
+            run = translate_batch(workbook, html_template_paths, header_footer_dir, images_dir, base_keyword,
+                                  languages, workspace, progress=language_done, images_ready=images_ready,
+                                  **options)
+            # Report every (template, language) pair on its own
+            results = {f"{name} {keyword}": result for name, template_results in run['results'].items()
+                       for keyword, result in template_results.items()}
+        cache_stats = render_cache.stats() if render_cache is not None else None
+        memory_stats = memory.stats() if memory is not None else None
+    finally:
+        if render_cache is not None:
+            render_cache.close()
+        if memory is not None:
+            memory.close()
+    return {'run': run, 'results': results, 'cache_stats': cache_stats, 'memory_stats': memory_stats}
+
+def zip_bytes(path):
+    # streamlit 1.37 wants the bytes themselves, so each zip is read once per version instead of on every rerun
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = st.session_state.setdefault('zip_bytes', {})
+    if str(path) not in cached or cached[str(path)][0] != version:
+        cached[str(path)] = (version, Path(path).read_bytes())
+    return cached[str(path)][1]
+
+def show_language(label, update):
+    status_column, download_column = st.columns([3, 1])
+    result = update['result']
+    if isinstance(result, Exception):
+        status_column.error(f"Failed to render {label}: {result}")
+    elif result['output_file'] is None:
+        status_column.warning(f"{label}: no header and footer folder found")
+    else:
+        source = " (from the render cache)" if result['cached'] else ""
+        status_column.write(f"{label}: {result['strings']} strings{source}")
+    if update['download'] and os.path.exists(update['download']):
+        download_column.download_button(f"Download {label}", zip_bytes(update['download']),
+                                        file_name=os.path.basename(update['download']), mime="application/zip",
+                                        key=f"download_{label}")
+
+def show_images_download():
+    # Zipped before any language, so it is complete once a language is reported
+    images_zip = st.session_state.get('images_zip')
+    if images_zip and os.path.exists(images_zip):
+        _, download_column = st.columns([3, 1])
+        download_column.download_button("Download images", zip_bytes(images_zip),
+                                        file_name="images.zip", mime="application/zip", key="download_images",
+                                        help="The images folder every language's page points at")
+
+@st.fragment(run_every=1)
+def show_progress():
+    """Poll the running job once a second and list the languages finished so far."""
+    job = st.session_state.job
+    updates = list(job.updates)
+    total = max(st.session_state.job_total, len(updates), 1)
+    st.progress(len(updates) / total, text=f"{len(updates)} of about {total} languages done ({job.elapsed:.0f} s)")
+    if updates:
+        show_images_download()
+    for label, update in updates:
+        show_language(label, update)
+    if job.done:
+        # Hand over to the full report below
+        st.rerun()
+
+def show_report(job):
+    show_images_download()
+    for label, update in job.updates:
+        show_language(label, update)
+    if job.error is not None:
+        st.error(f"The run failed after {job.elapsed:.0f} s: {job.error}")
+        return
+
+    run = job.result['run']
+    st.write(f"Finished in {job.elapsed:.1f} s")
+    if run.get('unchanged'):
+        st.write(f"Unchanged since the last run, kept as they were: {', '.join(run['unchanged'])}")
+    stats = job.result['cache_stats']
+    if stats is not None:
+        results = job.result['results']
+        cached = sum(1 for result in results.values() if isinstance(result, dict) and result['cached'])
+        st.write(f"{cached} of {len(results)} languages reused from the render cache "
+                 f"(all runs: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries, "
+                 f"{stats['bytes'] / 1024 / 1024:.1f} MB)")
+    stats = job.result['memory_stats']
+    if stats is not None:
+        run_stats = stats['run']
+        known = run_stats['known_strings'] / run_stats['strings'] if run_stats['strings'] else 0
+        patterns = run_stats['patterns_reused'] + run_stats['patterns_compiled']
+        reused = (f"; {run_stats['patterns_reused'] / patterns:.0%} of {patterns} string patterns were already compiled"
+                  if patterns else "")
+        st.write(f"Translation memory: {known:.0%} of {run_stats['strings']} strings translated before "
+                 f"({stats['stored_strings']} strings stored){reused}")
+
+    st.write("Stage timings (render and inject are summed over the parallel jobs)")
+    st.dataframe(run['profiler'].rows(), hide_index=True)
+
+    if run['zip_path']:
+        st.session_state.zip_path = run['zip_path']
+    else:
+        st.write("No files were organized or final output directory not found.")
+
 # Extract columns
 if st.button("Process Files"):
-    if input_excel_file_path and html_template_path and header_footer_dir:
-        st.write("Processing files...")
+    running = st.session_state.get('job')
+    if running is not None and not running.done:
+        st.warning("Files are still being processed, wait for that run to finish.")
+    elif input_excel_file and html_template_paths and header_footer_dir:
+        st.session_state.pop('zip_path', None)
+        st.session_state.zip_bytes = {}
         # output_file = 'output_converted.xlsx'
         # html_encoded_excel=convert_excel_text_to_html_entities(input_excel_file_path,output_file)
-        all_columns = extract_columns(output_file, keywords)
         # base_keyword = 'FR'
         
         # combination_keywords = ['SE']
         # combination_keywords = ['WW', 'NL','ES', 'DE','IT', 'NO', 'SE', 'DK','ME_AR','ME_EN']
        
-        create_combinations(all_columns, base_keyword,combination_keywords)
-        files_processed = 0
-        for filename in os.listdir(output_folder_path):
-            if filename.endswith(".xlsx"):
-                input_path = os.path.join(output_folder_path, filename)
-                process_excel_file(input_path)
-                files_processed += 1
-
-        print(f"Total files processed: {files_processed}")
-
-
-        process_folder(output_folder_path, html_template_path)
-
-        # os.makedirs(output_dir, exist_ok=True)
-        main(header_footer_dir, html_dir, output_dir)
-        
-        Final_output_dir = organize_html_files(output_dir, images_dir)
-        
-        if Final_output_dir:
-            def zip_directory(directory_path, zip_path):
-                with ZipFile(zip_path, 'w') as zipf:
-                    for root, _, files in os.walk(directory_path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            zipf.write(file_path, os.path.relpath(file_path, os.path.dirname(directory_path)))
-
-    # Zip the output directory
-            zip_path = f"{Final_output_dir}.zip"
-            zip_directory(Final_output_dir, zip_path)
-
-            with open(zip_path, 'rb') as f:
-                # Read the zip file content
-                zip_data = f.read()
-
-                # Custom CSS to align the button to the right
-                st.markdown("""
-                    <style>
-                    .download-button-wrapper {
-                        display: flex;
-                        justify-content: flex-end;
-                    }
-                    </style>
-                    """, 
-                    unsafe_allow_html=True)
-
-                # Encode zip data to base64
-                zip_data_b64 = base64.b64encode(zip_data).decode()
-
-                # Place the button inside a div with the custom style
-                st.markdown(f"""
-                    <div class="download-button-wrapper">
-                        <a href="data:application/zip;base64,{zip_data_b64}" download="{os.path.basename(zip_path)}" class="stDownloadButton">
-                            <button>Download Translated Files</button>
-                        </a>
-                    </div>""", unsafe_allow_html=True)
-                
-                # empty_directory(Final_output_dir)
-
-        else:
-            st.write("No files were organized or final output directory not found.")
-
-
-
+        # The same pipeline the command line uses, run in a background thread so the page stays responsive
+        options = dict(workers=int(workers), image_mode=image_mode, optimize_images_once=optimize_images_once,
+                       max_image_width=int(max_image_width) or None, compresslevel=compression_level,
+                       keep_excel_files=keep_excel_files)
+        # A buffer of its own, so the job does not share a read position with the page
+        st.session_state.job = BackgroundJob(run_pipeline, session_workspace(), BytesIO(output_file.getvalue()),
+                                             html_template_paths, header_footer_dir, images_dir, base_keyword,
+                                             combination_keywords, use_render_cache, use_memory, incremental,
+                                             options)
+        st.session_state.job_total = len(combination_keywords) * len(html_template_paths)
+        st.session_state.images_zip = (session_workspace() / 'languages' / 'images.zip'
+                                       if image_mode == 'shared' and images_dir else None)
+
+# The job lives in session state, so reruns caused by other widgets do not interrupt it
+job = st.session_state.get('job')
+if job is not None:
+    if job.done:
+        show_report(job)
+    else:
+        show_progress()
+
+# Offer the last archive of this session outside the button block so it survives reruns
+zip_path = st.session_state.get('zip_path')
+if zip_path and os.path.exists(zip_path):
+    # Align the button to the right
+    _, download_column = st.columns([3, 1])
+    download_column.download_button("Download Translated Files", zip_bytes(zip_path),
+                                    file_name=os.path.basename(zip_path), mime="application/zip")
@@ -0,0 +1,1460 @@
+import os
+import re
+import shutil
+import logging
+import bisect
+import concurrent.futures
+import heapq
+import math
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain, islice
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+# pandas and openpyxl are imported inside the functions that need them, so
+# importing this module (or running the CLI's --help) stays cheap
+
+from cache import render_key
+from entities import encode_cell, encode_column
+from incremental import (changed_columns, file_digest, load_snapshot, remove_snapshot, save_snapshot, snapshot_frame,
+                         tree_digest)
+from instrumentation import Profiler, rss_mb
+
+# Progress goes to this logger: per-file detail at DEBUG, a few lines per run
+# at INFO, problems at WARNING and above, which is all that shows by default
+logger = logging.getLogger(__name__)
+
+def read_html_file(html_file_path):
+    with open(html_file_path, 'r', encoding='utf-8') as file:
+        html_content = file.read()
+    return html_content
+
+def normalize_cell(cell):
+    # Collapse leading, trailing and repeated whitespace; empty cells become ""
+    if cell is None:
+        return ""
+    return ' '.join(str(cell).split())
+
+
+def create_pattern(text):
+    # Escape the text and allow for &nbsp; in addition to regular spaces
+    text = re.escape(text)
+    # Replace escaped spaces with a non-capturing group for spaces and &nbsp;
+    text = text.replace(r'\ ', r'(?:\s*|&nbsp;)')
+    return text
+
+class LooseTable(dict):
+    """
+    A str.translate() table that drops whitespace and folds case coarsely.
+
+    Any two characters that re.IGNORECASE treats as equal fold to the same
+    character, so a key can only match where its loose form occurs in the
+    loose text. Characters are added on first use.
+    """
+
+    def __missing__(self, code):
+        char = chr(code)
+        folded = None if char.isspace() else char.upper().casefold()[:1]
+        self[code] = folded
+        return folded
+
+loose_table = LooseTable()
+
+# Keys are indexed by this many characters at the start of their loose form
+HEAD_LENGTH = 3
+
+# Patterns compiled in this process, by key. The keys are the base language's
+# strings, shared by every language and mostly repeated from one run to the
+# next, so a pattern compiled for one dictionary serves all the later ones.
+# Pool workers outlive a run, so they keep theirs too.
+key_patterns = OrderedDict()
+key_patterns_lock = threading.Lock()
+MAX_KEY_PATTERNS = 20000
+
+def key_pattern(key):
+    """Return the pattern of key and whether it had to be compiled, which happens once per process."""
+    with key_patterns_lock:
+        pattern = key_patterns.get(key)
+        if pattern is not None:
+            key_patterns.move_to_end(key)
+            return pattern, False
+    pattern = re.compile(create_pattern(key), re.IGNORECASE)
+    with key_patterns_lock:
+        key_patterns[key] = pattern
+        while len(key_patterns) > MAX_KEY_PATTERNS:
+            key_patterns.popitem(last=False)
+    return pattern, True
+
+class CompiledReplacements:
+    """
+    A translation dict indexed for replace_keys().
+
+    The keys are sorted longest first and indexed by the start of their
+    loose form, so that only the keys that can start at a position are tried
+    there, each with its own pattern from key_pattern(). Building the index
+    compiles nothing, and it pickles as plain data: a worker process fetches
+    the patterns again. patterns_reused and patterns_compiled count the keys
+    whose pattern this process already had and those it had to compile.
+    """
+
+    def __init__(self, replacements):
+        self.keys = sorted((key for key in replacements if key), key=len, reverse=True)
+        self.values = [replacements[key] for key in self.keys]
+        # Indices of the keys with each loose form, and the loose lengths found after each head
+        self.loose_keys = {}
+        self.heads = {}
+        # Keys that can start on whitespace, tried at every position
+        self.anywhere = []
+        for index, key in enumerate(self.keys):
+            loose_key = key.translate(loose_table)
+            if not loose_key or key[0].isspace():
+                self.anywhere.append(index)
+                continue
+            self.loose_keys.setdefault(loose_key, []).append(index)
+            self.heads.setdefault(loose_key[:HEAD_LENGTH], set()).add(len(loose_key))
+        self.heads = {head: sorted(lengths, reverse=True) for head, lengths in self.heads.items()}
+        self.head_lengths = sorted({len(head) for head in self.heads}, reverse=True)
+        self.patterns = {}
+        self.patterns_reused = 0
+        self.patterns_compiled = 0
+
+    def __getstate__(self):
+        # Compiled patterns would be compiled again on unpickling, the receiving process fetches its own
+        return dict(self.__dict__, patterns={}, patterns_reused=0, patterns_compiled=0)
+
+    def pattern(self, index):
+        pattern = self.patterns.get(index)
+        if pattern is None:
+            pattern, compiled = key_pattern(self.keys[index])
+            self.patterns[index] = pattern
+            if compiled:
+                self.patterns_compiled += 1
+            else:
+                self.patterns_reused += 1
+        return pattern
+
+    def possible_starts(self, text):
+        """Map each position of text where a key may match to those keys' indices, longest key first."""
+        starts = {}
+        if self.heads:
+            loose_text = text.translate(loose_table)
+            positions = [index for index, char in enumerate(text) if not char.isspace()]
+            for offset, position in enumerate(positions):
+                found = []
+                for length in self.head_lengths:
+                    lengths = self.heads.get(loose_text[offset:offset + length])
+                    if lengths is None:
+                        continue
+                    for loose_length in lengths:
+                        if offset + loose_length <= len(loose_text):
+                            found.extend(self.loose_keys.get(loose_text[offset:offset + loose_length], ()))
+                if found:
+                    starts[position] = sorted(found)
+        if self.anywhere:
+            for position in range(len(text) + 1):
+                starts[position] = sorted(starts.get(position, []) + self.anywhere)
+        return starts
+
+    def translate_whole(self, value):
+        """Return the translation of the longest key that matches all of value, or None."""
+        for index in self.loose_keys.get(value.translate(loose_table), ()):
+            if self.pattern(index).fullmatch(value):
+                return self.values[index]
+        return None
+
+    def match(self, text, start, indices, end=None):
+        """Return (index, start, end) for the first of indices whose key matches at start, or None."""
+        end = len(text) if end is None else end
+        for index in indices:
+            match = self.pattern(index).match(text, start, end)
+            if match is not None:
+                return index, start, match.end()
+        return None
+
+def compile_replacements(replacements):
+    """Index a translation dict for replace_keys(); see CompiledReplacements."""
+    return CompiledReplacements(replacements)
+
+def replace_keys(text, compiled):
+    """
+    Replace the keys found in text with their translations, in one pass.
+
+    Where matches overlap the longest key wins, wherever it starts, and of
+    keys of the same length the one that comes first in the dict. A key that
+    loses only its end to a longer one is retried for a shorter key ending
+    before it. Translated text is never rescanned, so a shorter key cannot
+    re-translate it. &nbsp; is expected to be a plain space already, as in
+    CompiledTemplate's text segments.
+    """
+    possible = compiled.possible_starts(text)
+    # (index, start, end) of the longest key at each position; a lower index is a longer key
+    candidates = []
+    for start, indices in possible.items():
+        candidate = compiled.match(text, start, indices)
+        if candidate is not None:
+            candidates.append(candidate)
+    heapq.heapify(candidates)
+    starts, ends, indices = [], [], []
+    while candidates:
+        index, start, end = heapq.heappop(candidates)
+        i = bisect.bisect_right(starts, start)
+        if i and ends[i - 1] > start:
+            # Inside a longer key
+            continue
+        if i < len(starts) and starts[i] < end:
+            # The keys before this one did not match even without the limit
+            retry = possible[start]
+            candidate = compiled.match(text, start, retry[retry.index(index):], starts[i])
+            if candidate is not None:
+                heapq.heappush(candidates, candidate)
+            continue
+        starts.insert(i, start)
+        ends.insert(i, end)
+        indices.insert(i, index)
+
+    parts = []
+    position = 0
+    for start, end, index in zip(starts, ends, indices):
+        parts.append(text[position:start])
+        parts.append(compiled.values[index])
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+# Markup that is copied verbatim into every translation. The body of an Outlook
+# conditional comment is still markup, so only its delimiters are static.
+markup_pattern = re.compile(
+    r'<!--\[if[^\]]*\]>|<!\[endif\]-->|<!-->|<!--.*?-->'
+    r'|<(script|style)\b.*?</\1\s*>'
+    r'|<[!/?a-zA-Z][^>]*>',
+    re.DOTALL | re.IGNORECASE)
+
+# Attributes whose value is translated when a key matches all of it: links and
+# images can differ per language (URL rows are left unencoded for this), and
+# alt and title are text
+attribute_pattern = re.compile(r'''(\s(?:href|src|alt|title)\s*=\s*)("[^"]*"|'[^']*'|[^\s"'=<>`]+)''', re.IGNORECASE)
+
+class CompiledTemplate:
+    """
+    An HTML template split once into static markup and translatable text.
+
+    Tags, comments and <style>/<script> bodies are kept as static segments,
+    except the values of href, src, alt and title attributes, which are
+    replaced when a key matches the whole value but never substituted into.
+    Text segments are stored with &nbsp; already normalised, so rendering a
+    language only substitutes into them and joins the result.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.segments = []
+        self.text_indices = []
+        self.attribute_indices = []
+        position = 0
+        for match in markup_pattern.finditer(source):
+            self._add_text(source[position:match.start()])
+            if match.group(1) is None and match.group(0)[1:2].isalpha():
+                self._add_tag(match.group(0))
+            else:
+                self.segments.append(match.group(0))
+            position = match.end()
+        self._add_text(source[position:])
+
+    def _add_tag(self, tag):
+        position = 0
+        for match in attribute_pattern.finditer(tag):
+            start, end = match.span(2)
+            if tag[start] in '"\'':
+                # The quotes stay static
+                start, end = start + 1, end - 1
+            self.segments.append(tag[position:start])
+            self.attribute_indices.append(len(self.segments))
+            self.segments.append(tag[start:end])
+            position = end
+        self.segments.append(tag[position:])
+
+    def _add_text(self, text):
+        if not text:
+            return
+        # Replace &nbsp; with regular space once instead of once per language
+        text = text.replace('&nbsp;', ' ')
+        if not text.isspace():
+            self.text_indices.append(len(self.segments))
+        self.segments.append(text)
+
+    @classmethod
+    def from_file(cls, html_file_path):
+        return cls(read_html_file(html_file_path))
+
+    def render(self, compiled):
+        """Return the template translated with compile_replacements() output."""
+        if not compiled.keys:
+            return self.source
+        segments = list(self.segments)
+        for index in self.text_indices:
+            segments[index] = replace_keys(segments[index], compiled)
+        for index in self.attribute_indices:
+            translation = compiled.translate_whole(segments[index])
+            if translation is not None:
+                segments[index] = translation
+        return ''.join(segments)
+
+# pandas' default na_values. Cells holding exactly one of these read as
+# missing, as they did when the sheets were parsed with pandas.
+NA_STRINGS = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                        '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+
+def cell_value(cell):
+    """A read-only cell's value as pandas reads it: whole numbers as int, empty, error and NA cells as NaN."""
+    value = cell.value
+    if value is None or cell.data_type == 'e' or (isinstance(value, str) and value in NA_STRINGS):
+        return math.nan
+    if cell.data_type == 'n' and int(value) == value:
+        return int(value)
+    return value
+
+def sheet_rows(sheet):
+    """
+    Yield the rows of a read-only sheet one at a time, as tuples of cells.
+
+    Empty rows are kept, so positions stay sheet row numbers, except at the
+    end of the sheet, where they are dropped as pandas drops them.
+    """
+    blank_rows = 0
+    for row in sheet.iter_rows():
+        if all(cell.value is None or cell.value == "" for cell in row):
+            blank_rows += 1
+            continue
+        for _ in range(blank_rows):
+            yield ()
+        blank_rows = 0
+        yield row
+
+def find_header_row(head, keywords):
+    """Return the index of the first row with a cell that is exactly one of the keywords."""
+    for i, row in enumerate(head):
+        if any(isinstance(cell, str) and cell.strip() in keywords for cell in row):
+            return i
+    return None
+
+def extract_columns(file_path, keywords, header_search_rows=10):
+    """
+    Collect the language columns named in keywords from every sheet.
+
+    file_path may also be a file-like object holding the workbook, such as
+    an upload kept in memory.
+
+    The workbook is streamed once in read-only mode, a row at a time. For
+    each sheet the first header_search_rows rows are searched for the header,
+    then only the cells of the matched columns are kept, so memory grows with
+    the language columns and not with the rest of the workbook. A header cell
+    must equal a keyword once stripped, so 'NO' does not match 'NOTES'. The
+    first sheet that has a column wins.
+    """
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    keywords = frozenset(keywords)
+    columns = {}
+
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        logger.info(f"Sheets found: {wb.sheetnames}")
+
+        for sheet in wb.worksheets:
+            if sheet.title == "BALISES":
+                logger.debug(f"Skipping sheet: {sheet.title}")
+                continue
+
+            logger.debug(f"Processing sheet: {sheet.title}")
+            # The dimensions stored in the file may be wrong, read the rows that are there
+            sheet.reset_dimensions()
+
+            rows = sheet_rows(sheet)
+            head_rows = list(islice(rows, header_search_rows))
+            head = [[cell_value(cell) for cell in row] for row in head_rows]
+            column_row_index = find_header_row(head, keywords)
+
+            if column_row_index is None:
+                logger.info(f"No column names found within the first {header_search_rows} rows "
+                            f"in sheet {sheet.title}")
+                continue
+
+            matched = {}
+            for position, col in enumerate(head[column_row_index]):
+                if isinstance(col, str):
+                    col = col.strip()
+                    if col in keywords and col not in columns and col not in matched.values():
+                        matched[position] = col
+            logger.info(f"Matched columns in {sheet.title} (identified row {column_row_index}): "
+                        f"{list(matched.values())}")
+
+            if not matched:
+                continue
+
+            values = {position: [] for position in matched}
+            for row in chain(head_rows[column_row_index + 1:], rows):
+                for position, cells in values.items():
+                    cells.append(cell_value(row[position]) if position < len(row) else math.nan)
+            # Keep the sheet row numbers as the index, as before
+            start = column_row_index + 1
+            for position, col in matched.items():
+                columns[col] = pd.Series(values[position], index=range(start, start + len(values[position])),
+                                         dtype=object)
+    finally:
+        wb.close()
+
+    # Build the frame in one step instead of growing it a column at a time
+    return pd.DataFrame(columns)
+
+
+def create_combinations(df, base_keyword, combination_keywords, output_folder):
+    os.makedirs(output_folder, exist_ok=True)
+    
+    for keyword in combination_keywords:
+        if base_keyword in df.columns and keyword in df.columns:
+            combined_df = df[[base_keyword, keyword]]
+            output_file = os.path.join(output_folder, f'{keyword}.xlsx')
+            combined_df.to_excel(output_file, index=False)
+            logger.debug(f"Created file: {output_file}")
+
+
+def process_excel_file(input_file):
+    """
+    Entity-encode every text cell of a workbook in place.
+
+    The workbook is streamed row by row from a read-only workbook into a
+    write-only copy, which then replaces it, so neither is held in memory.
+    Only values are kept, not formatting.
+    """
+    from openpyxl import Workbook, load_workbook
+    from openpyxl.utils import get_column_letter
+
+    temporary_file = f"{input_file}.tmp"
+    try:
+        wb = load_workbook(input_file, read_only=True, data_only=True)
+        encoded_wb = Workbook(write_only=True)
+        logger.debug(f"Processing file: {input_file}")
+        try:
+            # Iterate through each sheet
+            for sheet in wb.worksheets:
+                logger.debug(f"Processing sheet: {sheet.title}")
+                encoded_sheet = encoded_wb.create_sheet(sheet.title)
+
+                for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                    encoded_row = []
+                    for column_number, value in enumerate(row, start=1):
+                        try:
+                            # Process only text cells, skipping URLs
+                            value = encode_cell(value)
+                        except Exception as e:
+                            coordinate = f"{get_column_letter(column_number)}{row_number}"
+                            logger.warning(f"Error processing cell {coordinate}: {e}")
+                        encoded_row.append(value)
+                    encoded_sheet.append(encoded_row)
+        finally:
+            wb.close()
+
+        # Save the modified workbook with the same name
+        encoded_wb.save(temporary_file)
+        os.replace(temporary_file, input_file)
+        logger.debug(f"Workbook saved to {input_file}")
+    except Exception as e:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+        logger.error(f"Failed to process file {input_file}: {e}")
+
+
+def translation_pairs_from_columns(sources, targets):
+    """
+    Yield (source, target) pairs straight from two entity-encoded columns.
+
+    This produces the same pairs as writing the two columns with
+    create_combinations, encoding them with process_excel_file and reading
+    back the first two columns of every sheet, without touching the disk.
+    """
+    import pandas as pd
+
+    for source, target in zip(sources.tolist(), targets.tolist()):
+        # Missing cells come back from the workbook as empty cells
+        source = normalize_cell(None if pd.isna(source) else source)
+        target = normalize_cell(None if pd.isna(target) else target)
+        if source and target:
+            yield source, target
+
+def write_language(keyword, html_dir, content, output_dir=None, output_content=None):
+    """Write a language's translated page, and its injected page if there is one."""
+    html_file = os.path.join(html_dir, f"{keyword}.html")
+    with open(html_file, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+    output_file = None
+    if output_content is not None:
+        output_file = os.path.join(output_dir, f"{keyword}.html")
+        with open(output_file, 'w', encoding='utf-8') as file:
+            file.write(output_content)
+
+    return {'keyword': keyword, 'html_file': html_file, 'output_file': output_file}
+
+def render_language(template, keyword, translations, html_dir, header_footer_content=None, output_dir=None,
+                    compiled=None):
+    """
+    Render one language into html_dir and, when the content of its
+    header/footer index.html is given, write the injected page into output_dir.
+
+    compiled is the compile_replacements() output for translations, when the
+    caller already has it. This is the unit of work handed to the process
+    pool, so it only takes picklable arguments and returns a small summary,
+    which counts the key patterns this render reused and compiled.
+    """
+    start = time.perf_counter()
+    if compiled is None:
+        compiled = compile_replacements(translations)
+    reused, built = compiled.patterns_reused, compiled.patterns_compiled
+    content = template.render(compiled)
+    render_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output_content = None
+    if header_footer_content is not None and output_dir:
+        output_content = inject_header_footer(content, header_footer_content)
+    inject_seconds = time.perf_counter() - start
+
+    summary = write_language(keyword, html_dir, content, output_dir, output_content)
+    # Sampled here, so a worker process reports its own memory
+    summary.update(strings=len(translations), cached=False, render_seconds=render_seconds,
+                   inject_seconds=inject_seconds, rss_mb=rss_mb(), patterns_reused=compiled.patterns_reused - reused,
+                   patterns_compiled=compiled.patterns_compiled - built)
+    return summary
+
+def write_debug_workbooks(df, base_keyword, combination_keywords, debug_excel_dir):
+    # The per-language workbooks, encoded as before, so they can be inspected
+    create_combinations(df, base_keyword, combination_keywords, debug_excel_dir)
+    for filename in os.listdir(debug_excel_dir):
+        if filename.endswith(".xlsx"):
+            process_excel_file(os.path.join(debug_excel_dir, filename))
+
+def language_inputs(df, base_keyword, combination_keywords, header_footer_dir=None, only=None):
+    """
+    Return, in combination_keywords order, each language's translation dict
+    and the content of its header/footer index.html (None if it has none).
+
+    Every column is encoded once and the header/footer folders are walked
+    once. Languages that are not in df are left out, and so are those not in
+    only, when it is given; they still count when matching header/footer
+    folders, so their folders are not reported as unused.
+    """
+    keywords = [keyword for keyword in combination_keywords if base_keyword in df.columns and keyword in df.columns]
+
+    header_footer_index = HeaderFooterIndex(header_footer_dir) if header_footer_dir else None
+    if header_footer_index is not None:
+        header_footer_index.report([f"{keyword}.html" for keyword in keywords])
+
+    if only is not None:
+        keywords = [keyword for keyword in keywords if keyword in only]
+    # The base column is encoded once and shared by all languages. A language
+    # column is encoded only while its dict is built, so one at a time is held.
+    encoded_base = encode_column(df[base_keyword]) if keywords else None
+
+    inputs = {}
+    for keyword in keywords:
+        translations = dict(translation_pairs_from_columns(encoded_base, encode_column(df[keyword])))
+        header_footer_content = None
+        if header_footer_index is not None:
+            index_filepath = header_footer_index.lookup(f"{keyword}.html")
+            if index_filepath is not None:
+                header_footer_content = read_html_file(index_filepath)
+        inputs[keyword] = (translations, header_footer_content)
+    return inputs
+
+# The process pool kept between runs, as (workers, pool), so that its workers
+# still have their key_patterns when the next run repeats most strings. A run
+# asking for another worker count replaces it. Sessions running at once share
+# it, so each run holds the pool it uses, and a pool that was replaced or broke
+# is shut down once the last run holding it lets go.
+worker_pool = None
+worker_pool_users = {}
+worker_pool_lock = threading.Lock()
+
+def acquire_worker_pool(workers):
+    global worker_pool
+    retired = None
+    with worker_pool_lock:
+        if worker_pool is None or worker_pool[0] != workers:
+            if worker_pool is not None and not worker_pool_users[worker_pool[1]]:
+                retired = worker_pool[1]
+                del worker_pool_users[retired]
+            # Spawn rather than fork, the Streamlit server process is multi-threaded
+            context = multiprocessing.get_context('spawn')
+            worker_pool = (workers, concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context))
+            worker_pool_users[worker_pool[1]] = 0
+        pool = worker_pool[1]
+        worker_pool_users[pool] += 1
+    if retired is not None:
+        retired.shutdown(wait=False)
+    return pool
+
+def release_worker_pool(pool, broken=False):
+    # A worker died, which breaks the whole pool; the next run starts a fresh one
+    global worker_pool
+    with worker_pool_lock:
+        if broken and worker_pool is not None and worker_pool[1] is pool:
+            worker_pool = None
+        worker_pool_users[pool] -= 1
+        retired = not worker_pool_users[pool] and (worker_pool is None or worker_pool[1] is not pool)
+        if retired:
+            del worker_pool_users[pool]
+    if retired:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def render_jobs(jobs, workers=1, cache=None, progress=None):
+    """
+    Run render_language() for every argument tuple in jobs, a dict with any
+    hashable keys, and return the summaries under the same keys and in the
+    same order. A job that fails maps to its exception instead, so it does
+    not stop the others.
+
+    With a RenderCache, jobs whose template, translations and header and
+    footer are unchanged since an earlier run are written from the cache
+    instead of being rendered again. With workers > 1 the other jobs are
+    rendered in a process pool. progress, if given, is called with the key
+    and summary (or exception) of each job as soon as it is finished.
+    """
+    progress = progress or (lambda job_key, result: None)
+    keys = {}
+    results = {}
+    pending = {}
+    for job_key, job in jobs.items():
+        template, keyword, translations, html_dir, header_footer_content, output_dir = job[:6]
+        if cache is not None:
+            keys[job_key] = render_key(template.source, translations, header_footer_content if output_dir else None)
+            cached = cache.get(keys[job_key])
+            if cached is not None:
+                results[job_key] = write_language(keyword, html_dir, cached[0], output_dir, cached[1])
+                results[job_key].update(strings=len(translations), cached=True)
+                progress(job_key, results[job_key])
+                continue
+        pending[job_key] = job
+
+    if workers > 1 and len(pending) > 1:
+        executor = acquire_worker_pool(workers)
+        broken = False
+        try:
+            futures = {}
+            for job_key, job in pending.items():
+                try:
+                    futures[executor.submit(render_language, *job)] = job_key
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    broken = True
+                    results[job_key] = e
+                    progress(job_key, e)
+            for future in concurrent.futures.as_completed(futures):
+                job_key = futures[future]
+                try:
+                    results[job_key] = future.result()
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    broken = True
+                    results[job_key] = e
+                except Exception as e:
+                    results[job_key] = e
+                progress(job_key, results[job_key])
+        finally:
+            release_worker_pool(executor, broken)
+    else:
+        for job_key, job in pending.items():
+            try:
+                results[job_key] = render_language(*job)
+            except Exception as e:
+                results[job_key] = e
+            progress(job_key, results[job_key])
+
+    if cache is not None:
+        for job_key in pending:
+            result = results[job_key]
+            if not isinstance(result, Exception):
+                output = read_html_file(result['output_file']) if result['output_file'] else None
+                cache.put(keys[job_key], read_html_file(result['html_file']), output)
+
+    # Keep the results in job order whether they came from the cache or not
+    return {job_key: results[job_key] for job_key in jobs}
+
+def record_results(profiler, results):
+    # Rendering and injection run in the workers, so their seconds are summed over jobs
+    for result in results:
+        if isinstance(result, Exception):
+            continue
+        html_bytes = os.path.getsize(result['html_file'])
+        output_bytes = os.path.getsize(result['output_file']) if result['output_file'] else 0
+        if result['cached']:
+            profiler.add('cache', rows=1, strings=result['strings'], bytes=html_bytes + output_bytes)
+            continue
+        profiler.add('render', result['render_seconds'], result['rss_mb'], rows=1, strings=result['strings'],
+                     bytes=html_bytes)
+        if result['output_file']:
+            profiler.add('inject', result['inject_seconds'], result['rss_mb'], rows=1, bytes=output_bytes)
+
+def encode_languages(profiler, df, base_keyword, combination_keywords, header_footer_dir=None, only=None):
+    with profiler.stage('encode') as stats:
+        inputs = language_inputs(df, base_keyword, combination_keywords, header_footer_dir, only)
+        stats['rows'] += len(df)
+        stats['strings'] += sum(len(translations) for translations, _ in inputs.values())
+    return inputs
+
+def combine_languages(profiler, df, base_keyword, combination_keywords, debug_excel_dir):
+    with profiler.stage('combine') as stats:
+        write_debug_workbooks(df, base_keyword, combination_keywords, debug_excel_dir)
+        stats['rows'] += len(df)
+        stats['bytes'] += directory_size(debug_excel_dir)
+
+def remember_languages(profiler, inputs, memory):
+    # Remember every language's strings in a TranslationMemory
+    with profiler.stage('memory') as stats:
+        for keyword, (translations, _) in inputs.items():
+            memory.remember(keyword, translations)
+            stats['strings'] += len(translations)
+
+def remember_patterns(memory, results):
+    # Count the key patterns the renders reused and compiled, wherever they ran
+    rendered = [result for result in results if not isinstance(result, Exception) and not result['cached']]
+    memory.count(patterns_reused=sum(result['patterns_reused'] for result in rendered),
+                 patterns_compiled=sum(result['patterns_compiled'] for result in rendered))
+
+def print_result(label, result):
+    if isinstance(result, Exception):
+        logger.error(f"Failed to render {label}: {result}")
+    else:
+        source = " (cached)" if result['cached'] else ""
+        logger.info(f"Rendered {label}: {result['strings']} strings{source}")
+
+def render_languages(df, base_keyword, combination_keywords, html_template_path, html_dir, debug_excel_dir=None,
+                     header_footer_dir=None, output_dir=None, workers=1, cache=None, profiler=None, only=None,
+                     progress=None, memory=None):
+    """
+    Render one HTML file per language directly from the extracted columns.
+
+    When debug_excel_dir is given the per-language workbooks are still written
+    there, encoded as before, so they can be inspected. When header_footer_dir
+    and output_dir are given each language is also injected with its header
+    and footer.
+
+    With a RenderCache, languages whose template, translations and header and
+    footer are unchanged since an earlier run are written from the cache
+    instead of being rendered again. With a TranslationMemory the strings are
+    remembered, and so are the counts of key patterns reused from earlier
+    languages and runs and compiled anew, in this process or the workers.
+
+    With workers > 1 the languages are rendered in a process pool. Returns a
+    dict in combination_keywords order mapping each language to its
+    render_language() summary, or to the exception that made it fail, so one
+    failing language does not stop the others.
+
+    With a Profiler the combine, encode, render, inject and cache stages are
+    recorded in it. When only is given just those languages are rendered.
+    progress is called with each language and its result as it finishes.
+    """
+    profiler = profiler if profiler is not None else Profiler()
+    if debug_excel_dir:
+        rendered_keywords = [keyword for keyword in combination_keywords if only is None or keyword in only]
+        combine_languages(profiler, df, base_keyword, rendered_keywords, debug_excel_dir)
+
+    # Parse the template once and reuse it for every language
+    template = CompiledTemplate.from_file(html_template_path)
+    os.makedirs(html_dir, exist_ok=True)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    inputs = encode_languages(profiler, df, base_keyword, combination_keywords, header_footer_dir, only)
+    if memory is not None:
+        remember_languages(profiler, inputs, memory)
+    # Each job indexes its own dictionary, which is cheap; the key patterns come from its process
+    jobs = {keyword: (template, keyword, translations, html_dir, header_footer_content, output_dir)
+            for keyword, (translations, header_footer_content) in inputs.items()}
+    results = render_jobs(jobs, workers, cache, progress)
+    record_results(profiler, results.values())
+    if memory is not None:
+        remember_patterns(memory, results.values())
+    for keyword, result in results.items():
+        print_result(keyword, result)
+    return results
+
+def template_name(html_template_path):
+    return os.path.splitext(os.path.basename(html_template_path))[0]
+
+def render_batch(df, base_keyword, combination_keywords, html_template_paths, html_dir, debug_excel_dir=None,
+                 header_footer_dir=None, output_dir=None, workers=1, cache=None, profiler=None, progress=None,
+                 memory=None):
+    """
+    Render every template in html_template_paths into every language.
+
+    The columns are encoded, the translation dicts built and compiled and the
+    header/footer folders walked once for the whole batch, so each language's
+    compiled replacements are shared by all templates. A template is written
+    to html_dir/<name>/ and output_dir/<name>/, <name> being its file name
+    without the extension. The (template, language) jobs are scheduled over
+    one pool, as in render_languages.
+
+    Returns a dict mapping each template name to its per-language results,
+    in the same form render_languages returns them. progress is called with
+    each (template name, language) pair and its result as it finishes. With a
+    TranslationMemory the strings and key pattern counts are remembered.
+    """
+    profiler = profiler if profiler is not None else Profiler()
+    templates = {}
+    for html_template_path in html_template_paths:
+        name = template_name(html_template_path)
+        if name in templates:
+            raise ValueError(f"More than one template is named '{name}'")
+        templates[name] = CompiledTemplate.from_file(html_template_path)
+
+    if debug_excel_dir:
+        combine_languages(profiler, df, base_keyword, combination_keywords, debug_excel_dir)
+
+    inputs = encode_languages(profiler, df, base_keyword, combination_keywords, header_footer_dir)
+    if memory is not None:
+        remember_languages(profiler, inputs, memory)
+    compiled = {keyword: compile_replacements(translations) for keyword, (translations, _) in inputs.items()}
+
+    jobs = {}
+    for name, template in templates.items():
+        template_html_dir = os.path.join(html_dir, name)
+        os.makedirs(template_html_dir, exist_ok=True)
+        template_output_dir = os.path.join(output_dir, name) if output_dir else None
+        if template_output_dir:
+            os.makedirs(template_output_dir, exist_ok=True)
+        for keyword, (translations, header_footer_content) in inputs.items():
+            jobs[name, keyword] = (template, keyword, translations, template_html_dir, header_footer_content,
+                                   template_output_dir, compiled[keyword])
+
+    job_results = render_jobs(jobs, workers, cache, progress)
+    record_results(profiler, job_results.values())
+    if memory is not None:
+        remember_patterns(memory, job_results.values())
+    results = {name: {} for name in templates}
+    for (name, keyword), result in job_results.items():
+        results[name][keyword] = result
+        print_result(f"{name} {keyword}", result)
+    return results
+
+
+# Both marked blocks in one pattern; group 2 says which block it is
+marker_pattern = re.compile(r'(<!--(Header|Footer) Code Start-->)(.*?)(<!--\2 Code End-->)', re.DOTALL)
+
+def extract_blocks(index_content):
+    """Return the first Header and Footer block of a header/footer index.html, by name."""
+    blocks = {}
+    for match in marker_pattern.finditer(index_content):
+        blocks.setdefault(match.group(2), match.group(3))
+    return blocks
+
+def inject_header_footer(content, index_content):
+    """Copy the header and footer blocks of a header/footer index.html into content in one scan."""
+    blocks = extract_blocks(index_content)
+    # A missing block in index.html empties the page's block, as before
+    return marker_pattern.sub(lambda match: match.group(1) + blocks.get(match.group(2), '') + match.group(4), content)
+
+def normalize_folder_name(name):
+    # Header/footer folders ignore underscores and spaces
+    return name.replace('_', '').replace(' ', '')
+
+def normalize_page_name(filename):
+    # Pages ignore spaces and the .html extension
+    return filename.replace(' ', '')[:-len('.html')]
+
+class HeaderFooterIndex:
+    """
+    The header/footer folders of a run, walked once and indexed by normalised name.
+
+    A page matches the folder whose name equals the page name once
+    underscores and spaces are removed, e.g. 'ME AR.html' matches 'ME_AR/'.
+    When several folders normalise to the same name, the last one walked wins.
+    """
+
+    def __init__(self, header_footer_dir):
+        self.folders = {}
+        self.without_index = {}
+        walk = os.walk(header_footer_dir)
+        next(walk, None)  # The top folder itself is not a header/footer folder
+        for root, dirs, files in walk:
+            name = normalize_folder_name(os.path.basename(root))
+            if 'index.html' in files:
+                self.folders[name] = os.path.join(root, 'index.html')
+            else:
+                self.without_index.setdefault(name, root)
+
+    def lookup(self, html_filename):
+        """Return the index.html path for a page, or None."""
+        return self.folders.get(normalize_page_name(html_filename))
+
+    def report(self, html_filenames):
+        """
+        Print, in one warning each, the folders no page uses, the pages with
+        no folder and the pages whose folder has no index.html. Returns the
+        same three lists.
+        """
+        names = {normalize_page_name(filename): filename for filename in html_filenames}
+        unmatched_folders = sorted(os.path.dirname(self.folders[name]) for name in set(self.folders) - set(names))
+        without_index = sorted(self.without_index[name] for name in set(names) - set(self.folders)
+                               if name in self.without_index)
+        unmatched_pages = sorted(filename for name, filename in names.items()
+                                 if name not in self.folders and name not in self.without_index)
+        if unmatched_folders:
+            logger.warning(f"Warning: No HTML file found for header and footer folders: "
+                           f"{', '.join(unmatched_folders)}")
+        if without_index:
+            logger.warning(f"Warning: 'index.html' not found in: {', '.join(without_index)}")
+        if unmatched_pages:
+            logger.warning(f"Warning: No header and footer folder found for: {', '.join(unmatched_pages)}")
+        return {'unmatched_folders': unmatched_folders, 'without_index': without_index,
+                'unmatched_pages': unmatched_pages}
+
+
+# What the pipeline reads from each uploaded zip
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.bmp')
+
+def is_header_footer_entry(name):
+    return name.rsplit('/', 1)[-1] == 'index.html'
+
+def is_image_entry(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+def extract_zip_entries(zip_file, target_dir, wanted):
+    """
+    Extract only the files of a zip whose name wanted(name) accepts.
+
+    zip_file is a path or a file-like object such as an upload. Only the
+    central directory is read up front, and skipped entries are never
+    decompressed. Every folder is still created, so a header/footer folder
+    without an index.html is reported as before. macOS metadata (__MACOSX/
+    and ._ files) is ignored. Returns the number of files extracted.
+    """
+    extracted = 0
+    with ZipFile(zip_file) as zip_ref:
+        for info in zip_ref.infolist():
+            parts = info.filename.split('/')
+            if '__MACOSX' in parts or parts[-1].startswith('._'):
+                continue
+            if info.is_dir() or not wanted(info.filename):
+                # Keep the folder, leaving out anything that would escape target_dir
+                folders = [part for part in parts[:-1] if part not in ('', '.', '..')]
+                os.makedirs(os.path.join(target_dir, *folders), exist_ok=True)
+                continue
+            zip_ref.extract(info, target_dir)
+            extracted += 1
+    logger.debug(f"Extracted {extracted} files into {target_dir}")
+    return extracted
+
+def get_immediate_images_directory(images_directory):
+    for root, dirs, files in os.walk(images_directory):
+        # Check if the current directory has image files directly within it
+        if any(file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')) for file in files):
+            return root
+    return None
+
+def normalize_name(name):
+    # Normalize the name by removing spaces and converting to lowercase
+    return name.replace(" ", "").lower()
+
+# Relative references to the per-language images folder in src/href/background
+# attributes and CSS url(), rewritten when the images are shared
+images_reference_pattern = re.compile(
+    r'''(\b(?:src|href|background)\s*=\s*["']?|url\(\s*["']?)images/''', re.IGNORECASE)
+
+def link_or_copy(source, destination):
+    # Hard links cost no extra disk space; fall back to a copy across file systems
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+    return destination
+
+def optimize_images(source_directory, target_directory, max_width=None, jpeg_quality=85):
+    """
+    Write a recompressed, optionally downsized copy of the images in source_directory.
+
+    Meant to run once per run, before the images are shared between
+    languages. PNG and JPEG files are re-encoded with Pillow. Without
+    max_width a re-encoded file is only kept if it is smaller. Other files,
+    such as possibly animated GIFs, are copied unchanged.
+    """
+    from PIL import Image
+
+    os.makedirs(target_directory, exist_ok=True)
+    for filename in os.listdir(source_directory):
+        source = os.path.join(source_directory, filename)
+        target = os.path.join(target_directory, filename)
+        if os.path.isdir(source):
+            shutil.copytree(source, target, dirs_exist_ok=True)
+            continue
+
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in ('.png', '.jpg', '.jpeg'):
+            shutil.copy2(source, target)
+            continue
+
+        with Image.open(source) as image:
+            resized = bool(max_width) and image.width > max_width
+            if resized:
+                image.thumbnail((max_width, image.height))
+            if extension == '.png':
+                image.save(target, optimize=True)
+            else:
+                image.convert('RGB').save(target, quality=jpeg_quality, optimize=True, progressive=True)
+        if not resized and os.path.getsize(target) >= os.path.getsize(source):
+            shutil.copy2(source, target)
+    return target_directory
+
+def organize_html_files(directory_path, images_directory, image_mode='copy'):
+    """
+    Move each translated HTML file into its own folder together with the images.
+
+    image_mode decides how the images reach those folders:
+    - 'copy' copies the images folder into every language folder.
+    - 'hardlink' keeps that layout, but the files are hard links to one copy.
+    - 'shared' puts a single images folder next to the language folders and
+      rewrites the pages' images/ references to ../images/, so the images are
+      stored only once on disk and in the zip.
+    """
+    # Ensure the directories exist
+    if not os.path.exists(directory_path):
+        logger.warning(f"Directory '{directory_path}' does not exist.")
+        return None
+    if not os.path.exists(images_directory):
+        logger.warning(f"Images directory '{images_directory}' does not exist.")
+        return None
+
+    immediate_images_directory = get_immediate_images_directory(images_directory)
+    if not immediate_images_directory:
+        logger.warning(f"No immediate directory containing images found in '{images_directory}'.")
+        return None
+
+    # Normalize the name of the immediate images directory for comparison
+    normalized_immediate_images_directory = normalize_name(os.path.basename(immediate_images_directory))
+
+    if image_mode == 'shared':
+        shutil.copytree(immediate_images_directory, os.path.join(directory_path, "images"), symlinks=True,
+                        dirs_exist_ok=True)
+
+    # Iterate through files in the directory
+    for filename in os.listdir(directory_path):
+        if filename.endswith(".html"):
+            file_path = os.path.join(directory_path, filename)
+
+            # Normalize the filename for comparison
+            normalized_filename = normalize_name(os.path.splitext(filename)[0])
+            
+            # Check if there is a corresponding directory name that matches the normalized filename
+            matching_directories = [
+                d for d in os.listdir(directory_path)
+                if os.path.isdir(os.path.join(directory_path, d)) and normalize_name(d) == normalized_filename
+            ]
+
+            if matching_directories:
+                # Use the first matching directory
+                new_directory = os.path.join(directory_path, matching_directories[0])
+            else:
+                # Create a directory with the normalized filename if no match is found
+                new_directory = os.path.join(directory_path, normalized_filename)
+                os.makedirs(new_directory, exist_ok=True)
+
+            # Move the HTML file into the new directory
+            shutil.move(file_path, new_directory)
+
+            new_images_directory = os.path.join(new_directory, "images")
+            if image_mode == 'shared':
+                # Point the page at the images folder one level up
+                moved_file_path = os.path.join(new_directory, filename)
+                content = images_reference_pattern.sub(r'\1../images/', read_html_file(moved_file_path))
+                with open(moved_file_path, 'w', encoding='utf-8') as file:
+                    file.write(content)
+                logger.debug(f"Moved '{filename}' to '{new_directory}' using the shared images folder.")
+            elif image_mode == 'hardlink':
+                shutil.copytree(immediate_images_directory, new_images_directory, symlinks=True,
+                                copy_function=link_or_copy)
+                logger.debug(f"Moved '{filename}' and linked images from '{immediate_images_directory}' to '{new_directory}'.")
+            else:
+                # Copy the immediate 'Images' directory into the new directory
+                shutil.copytree(immediate_images_directory, new_images_directory, symlinks=True)
+
+                logger.debug(f"Moved '{filename}' and copied images from '{immediate_images_directory}' to '{new_directory}'.")
+
+    return directory_path  # Return the organized files directory
+
+
+# Formats that are already compressed; deflating them again costs time and saves nothing
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.zip', '.gz', '.mp4', '.pdf')
+
+def zip_directory(directory_path, zip_path, compresslevel=6):
+    """
+    Zip directory_path into zip_path, with the directory itself as the top level entry.
+
+    Files are streamed into the archive one chunk at a time, so memory use
+    does not grow with the archive. Text is deflated at compresslevel and
+    already-compressed images are stored as they are.
+    """
+    with ZipFile(zip_path, 'w', compression=ZIP_DEFLATED, compresslevel=compresslevel) as zipf:
+        add_to_zip(zipf, directory_path, os.path.dirname(directory_path))
+    return zip_path
+
+def add_to_zip(zipf, directory_path, start):
+    # Entries are named relative to start
+    for root, _, files in os.walk(directory_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            arcname = os.path.relpath(file_path, start)
+            if file.lower().endswith(STORED_EXTENSIONS):
+                zipf.write(file_path, arcname, compress_type=ZIP_STORED)
+            else:
+                zipf.write(file_path, arcname)
+
+def update_zip(zip_path, directory_path, folders, compresslevel=6):
+    """
+    Replace the given language folders of directory_path in an archive made by zip_directory.
+
+    Entries outside those folders are copied over from the old archive
+    without touching the disk. Folders that no longer exist in
+    directory_path are dropped from the archive.
+    """
+    start = os.path.dirname(directory_path)
+    prefixes = tuple(f"{os.path.basename(directory_path)}/{folder}/" for folder in folders)
+    temporary_path = f"{zip_path}.tmp"
+    with ZipFile(zip_path) as old_zip, \
+            ZipFile(temporary_path, 'w', compression=ZIP_DEFLATED, compresslevel=compresslevel) as zipf:
+        for info in old_zip.infolist():
+            if not info.filename.startswith(prefixes):
+                with old_zip.open(info) as source, zipf.open(info, 'w') as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+        for folder in folders:
+            if os.path.isdir(os.path.join(directory_path, folder)):
+                add_to_zip(zipf, os.path.join(directory_path, folder), start)
+    os.replace(temporary_path, zip_path)
+    return zip_path
+
+def directory_size(directory_path):
+    return sum(os.path.getsize(os.path.join(root, file))
+               for root, _, files in os.walk(directory_path) for file in files)
+
+def extract_stage(profiler, workbook, keywords):
+    with profiler.stage('extract') as stats:
+        all_columns = extract_columns(workbook, keywords)
+        stats['rows'] += len(all_columns)
+        stats['strings'] += int(all_columns.notna().sum().sum())
+    return all_columns
+
+def package_stage(profiler, output_dir, images_dir, image_mode, compresslevel, zip_output, template_names=None):
+    """
+    Organise the rendered pages with their images and zip the result.
+
+    Without template_names output_dir holds the pages of one template,
+    otherwise one folder of pages per template name. Returns the organised
+    directory and the zip path, each None if that step did not happen.
+    """
+    final_output_dir = None
+    if images_dir:
+        with profiler.stage('organize') as stats:
+            if template_names is None:
+                final_output_dir = organize_html_files(output_dir, images_dir, image_mode)
+            elif template_names:
+                # Each template folder is organised into language folders of its own
+                organized = [organize_html_files(os.path.join(output_dir, name), images_dir, image_mode)
+                             for name in template_names]
+                final_output_dir = output_dir if all(organized) else None
+            if final_output_dir:
+                stats['rows'] += sum(1 for _, _, files in os.walk(final_output_dir)
+                                     for file in files if file.endswith('.html'))
+                stats['bytes'] += directory_size(final_output_dir)
+
+    zip_path = None
+    if final_output_dir and zip_output:
+        with profiler.stage('zip') as stats:
+            zip_path = zip_directory(final_output_dir, f"{final_output_dir}.zip", compresslevel=compresslevel)
+            stats['bytes'] += os.path.getsize(zip_path)
+    return final_output_dir, zip_path
+
+def prepare_images(images_dir, work_dir, optimize_images_once=False, max_image_width=None):
+    """Return the images to organise, recompressed once into work_dir/optimized_images if asked."""
+    if optimize_images_once and images_dir and get_immediate_images_directory(images_dir):
+        # Recompress once per run; every language then reuses the result
+        optimized_images_dir = os.path.join(work_dir, 'optimized_images')
+        recreate_directory(optimized_images_dir)
+        return optimize_images(get_immediate_images_directory(images_dir), optimized_images_dir,
+                               max_width=max_image_width)
+    return images_dir
+
+def images_stage(profiler, images_dir, work_dir, optimize_images_once=False, max_image_width=None,
+                 images_ready=None, reuse=False):
+    # With reuse, the copy recompressed by the last run is used as it is, if there is one
+    optimized_images_dir = os.path.join(work_dir, 'optimized_images')
+    if reuse and optimize_images_once and os.path.isdir(optimized_images_dir):
+        images_dir = optimized_images_dir
+    else:
+        with profiler.stage('images'):
+            images_dir = prepare_images(images_dir, work_dir, optimize_images_once, max_image_width)
+    if images_ready is not None:
+        images_ready(images_dir)
+    return images_dir
+
+def add_images_to_zip(zipf, images_dir, folder):
+    # The folder holding the images, as organize_html_files finds it, goes in as folder
+    immediate_images_directory = get_immediate_images_directory(images_dir) if images_dir else None
+    if not immediate_images_directory:
+        return
+    for root, _, files in os.walk(immediate_images_directory):
+        for file in files:
+            file_path = os.path.join(root, file)
+            arcname = f"{folder}/{os.path.relpath(file_path, immediate_images_directory)}"
+            compress_type = ZIP_STORED if file.lower().endswith(STORED_EXTENSIONS) else ZIP_DEFLATED
+            zipf.write(file_path, arcname, compress_type=compress_type)
+
+def zip_language(page_path, images_dir, zip_path, compresslevel=6, image_mode='copy'):
+    """
+    Zip one translated page, laid out as its folder in the full archive.
+
+    Lets a finished language be downloaded before the whole run is done. The
+    images go in the language's folder, except with image_mode 'shared',
+    where the page points at ../images/ and the images are zipped once for
+    every language with zip_images.
+    """
+    folder = normalize_name(os.path.splitext(os.path.basename(page_path))[0])
+    arcname = f"{folder}/{os.path.basename(page_path)}"
+    with ZipFile(zip_path, 'w', compression=ZIP_DEFLATED, compresslevel=compresslevel) as zipf:
+        if image_mode == 'shared':
+            zipf.writestr(arcname, images_reference_pattern.sub(r'\1../images/', read_html_file(page_path)))
+        else:
+            zipf.write(page_path, arcname)
+            add_images_to_zip(zipf, images_dir, f"{folder}/images")
+    return zip_path
+
+def zip_images(images_dir, zip_path):
+    """Zip the images as the shared images/ folder of the full archive."""
+    with ZipFile(zip_path, 'w', compression=ZIP_DEFLATED) as zipf:
+        add_images_to_zip(zipf, images_dir, 'images')
+    return zip_path
+
+def translate_newsletter(workbook, html_template_path, header_footer_dir, images_dir, base_keyword, languages,
+                         work_dir, workers=1, cache=None, image_mode='copy', optimize_images_once=False,
+                         max_image_width=None, compresslevel=6, keep_excel_files=False, zip_output=True,
+                         profiler=None, progress=None, memory=None, images_ready=None):
+    """
+    Run the whole pipeline for one workbook and one template, without Streamlit.
+
+    Everything is written under work_dir: processed_excel_files/ (only with
+    keep_excel_files), html/, Translated_Files/ and Translated_Files.zip.
+    Those folders are recreated first, and the snapshot of an earlier
+    translate_incremental run is removed, as it no longer describes the
+    output. Returns a dict with the per-language
+    results of render_languages, the organised output directory (None if
+    nothing could be organised), the zip path (None without zip_output), the
+    Profiler holding the timings of every stage and the extracted columns.
+    progress is handed to render_languages to follow the languages as they
+    finish, and memory, a TranslationMemory, to remember the strings.
+    The images are prepared before rendering and images_ready, if given, is
+    called with their directory, so anything zipped as the languages finish
+    holds the same images as the final archive.
+    """
+    profiler = profiler if profiler is not None else Profiler()
+    excel_dir = os.path.join(work_dir, 'processed_excel_files')
+    html_dir = os.path.join(work_dir, 'html')
+    output_dir = os.path.join(work_dir, 'Translated_Files')
+    remove_snapshot(work_dir)
+    for directory in (excel_dir, html_dir, output_dir):
+        recreate_directory(directory)
+
+    keywords = [base_keyword] + [keyword for keyword in languages if keyword != base_keyword]
+    all_columns = extract_stage(profiler, workbook, keywords)
+    images_dir = images_stage(profiler, images_dir, work_dir, optimize_images_once, max_image_width, images_ready)
+    results = render_languages(all_columns, base_keyword, keywords[1:], html_template_path, html_dir,
+                               excel_dir if keep_excel_files else None, header_footer_dir, output_dir,
+                               workers=workers, cache=cache, profiler=profiler, progress=progress, memory=memory)
+
+    final_output_dir, zip_path = package_stage(profiler, output_dir, images_dir, image_mode, compresslevel,
+                                               zip_output)
+    return {'results': results, 'output_dir': final_output_dir, 'zip_path': zip_path, 'profiler': profiler,
+            'columns': all_columns}
+
+def run_state(html_template_path, header_footer_dir, images_dir, base_keyword, languages, **options):
+    """
+    What a run's output depends on besides the workbook, as saved with its snapshot.
+
+    'run' covers the template, images, base language and options, any
+    change to which needs a full run. 'languages' holds a digest of each
+    language's header/footer index.html, so a changed header or footer
+    re-renders that language alone.
+    """
+    header_footer_index = HeaderFooterIndex(header_footer_dir) if header_footer_dir else None
+    header_footers = {}
+    for keyword in languages:
+        index_filepath = header_footer_index.lookup(f"{keyword}.html") if header_footer_index else None
+        header_footers[keyword] = file_digest(index_filepath) if index_filepath else None
+    run = dict(options, template=file_digest(html_template_path), base_keyword=base_keyword,
+               images=tree_digest(images_dir) if images_dir else None)
+    return {'run': run, 'languages': header_footers}
+
+def language_folders(directory_path, keywords):
+    # The folders organize_html_files put these languages in
+    names = {normalize_name(keyword) for keyword in keywords}
+    return [d for d in os.listdir(directory_path)
+            if os.path.isdir(os.path.join(directory_path, d)) and normalize_name(d) in names]
+
+def translate_incremental(workbook, html_template_path, header_footer_dir, images_dir, base_keyword, languages,
+                          work_dir, workers=1, cache=None, image_mode='copy', optimize_images_once=False,
+                          max_image_width=None, compresslevel=6, keep_excel_files=False, profiler=None, progress=None,
+                          memory=None, images_ready=None):
+    """
+    Like translate_newsletter, but only re-render the languages that changed since the last run in work_dir.
+
+    Each run saves the extracted columns (snapshot.parquet) and what else
+    the output depends on (snapshot.json) in work_dir. The next run diffs the
+    new workbook against them: a language is rendered again if its column,
+    the base column or its header/footer changed, and only its folder is
+    organised again and its entries rewritten in Translated_Files.zip.
+    A new template, images or options, or a missing snapshot or archive,
+    falls back to a full run. The result also lists the unchanged languages.
+    """
+    profiler = profiler if profiler is not None else Profiler()
+    keywords = [base_keyword] + [keyword for keyword in languages if keyword != base_keyword]
+    options = dict(image_mode=image_mode, optimize_images_once=optimize_images_once, max_image_width=max_image_width)
+    state = run_state(html_template_path, header_footer_dir, images_dir, base_keyword, keywords[1:], **options)
+
+    output_dir = os.path.join(work_dir, 'Translated_Files')
+    zip_path = f"{output_dir}.zip"
+    previous = load_snapshot(work_dir)
+    if previous is None or previous[1]['run'] != state['run'] or not images_dir or not os.path.exists(zip_path):
+        logger.info("No usable snapshot of an earlier run, translating every language")
+        run = translate_newsletter(workbook, html_template_path, header_footer_dir, images_dir, base_keyword,
+                                   languages, work_dir, workers=workers, cache=cache, image_mode=image_mode,
+                                   optimize_images_once=optimize_images_once, max_image_width=max_image_width,
+                                   compresslevel=compresslevel, keep_excel_files=keep_excel_files, profiler=profiler,
+                                   progress=progress, memory=memory, images_ready=images_ready)
+        if run['zip_path']:
+            rendered = {keyword: state['languages'][keyword] for keyword, result in run['results'].items()
+                        if not isinstance(result, Exception)}
+            save_snapshot(work_dir, run['columns'], dict(state, languages=rendered))
+        run['unchanged'] = []
+        return run
+
+    previous_columns, previous_state = previous
+    all_columns = extract_stage(profiler, workbook, keywords)
+    with profiler.stage('diff') as stats:
+        changed = set(changed_columns(previous_columns, snapshot_frame(all_columns), base_keyword, keywords[1:]))
+        affected = [keyword for keyword in keywords[1:] if keyword in changed
+                    or keyword not in previous_state['languages']
+                    or previous_state['languages'][keyword] != state['languages'][keyword]]
+        removed = [keyword for keyword in previous_state['languages'] if keyword not in keywords[1:]]
+        stats['rows'] += len(affected) + len(removed)
+    logger.info(f"Languages to render again: {', '.join(affected) or 'none'}")
+
+    # Their folders are organised again from scratch, and the removed ones dropped
+    stale_folders = language_folders(output_dir, affected + removed)
+    for folder in stale_folders:
+        shutil.rmtree(os.path.join(output_dir, folder))
+
+    html_dir = os.path.join(work_dir, 'html')
+    excel_dir = os.path.join(work_dir, 'processed_excel_files')
+    results = {}
+    if affected:
+        # Same images and options as last time, so last time's recompressed copy can be used as it is
+        images_dir = images_stage(profiler, images_dir, work_dir, optimize_images_once, max_image_width,
+                                  images_ready, reuse=True)
+        results = render_languages(all_columns, base_keyword, keywords[1:], html_template_path, html_dir,
+                                   excel_dir if keep_excel_files else None, header_footer_dir, output_dir,
+                                   workers=workers, cache=cache, profiler=profiler, only=affected, progress=progress,
+                                   memory=memory)
+        with profiler.stage('organize') as stats:
+            organize_html_files(output_dir, images_dir, image_mode)
+            stats['rows'] += len(results)
+
+    folders = sorted(set(stale_folders) | set(language_folders(output_dir, affected)))
+    if folders:
+        with profiler.stage('zip') as stats:
+            update_zip(zip_path, output_dir, folders, compresslevel=compresslevel)
+            stats['rows'] += len(folders)
+            stats['bytes'] += os.path.getsize(zip_path)
+
+    rendered = {keyword: digest for keyword, digest in previous_state['languages'].items()
+                if keyword not in affected and keyword not in removed}
+    rendered.update((keyword, state['languages'][keyword]) for keyword, result in results.items()
+                    if not isinstance(result, Exception))
+    save_snapshot(work_dir, all_columns, dict(state, languages=rendered))
+    unchanged = [keyword for keyword in keywords[1:] if keyword not in affected and keyword in rendered]
+    return {'results': results, 'output_dir': output_dir, 'zip_path': zip_path, 'profiler': profiler,
+            'columns': all_columns, 'unchanged': unchanged}
+
+def translate_batch(workbook, html_template_paths, header_footer_dir, images_dir, base_keyword, languages,
+                    work_dir, workers=1, cache=None, image_mode='copy', optimize_images_once=False,
+                    max_image_width=None, compresslevel=6, keep_excel_files=False, zip_output=True,
+                    profiler=None, progress=None, memory=None, images_ready=None):
+    """
+    Run the whole pipeline for one workbook and several templates at once.
+
+    Like translate_newsletter, but the workbook is read once for every
+    template and the result is one tree, Translated_Files/<template>/<language>/,
+    zipped as a whole. Returns a dict with the render_batch results, the
+    organised output directory, the zip path and the Profiler.
+    """
+    profiler = profiler if profiler is not None else Profiler()
+    excel_dir = os.path.join(work_dir, 'processed_excel_files')
+    html_dir = os.path.join(work_dir, 'html')
+    output_dir = os.path.join(work_dir, 'Translated_Files')
+    remove_snapshot(work_dir)
+    for directory in (excel_dir, html_dir, output_dir):
+        recreate_directory(directory)
+
+    keywords = [base_keyword] + [keyword for keyword in languages if keyword != base_keyword]
+    all_columns = extract_stage(profiler, workbook, keywords)
+    images_dir = images_stage(profiler, images_dir, work_dir, optimize_images_once, max_image_width, images_ready)
+    results = render_batch(all_columns, base_keyword, keywords[1:], html_template_paths, html_dir,
+                           excel_dir if keep_excel_files else None, header_footer_dir, output_dir,
+                           workers=workers, cache=cache, profiler=profiler, progress=progress, memory=memory)
+
+    final_output_dir, zip_path = package_stage(profiler, output_dir, images_dir, image_mode, compresslevel,
+                                               zip_output, template_names=list(results))
+    return {'results': results, 'output_dir': final_output_dir, 'zip_path': zip_path, 'profiler': profiler}
+
+def remove_dir(directory_path):
+    """
+    Removes a directory and all its contents.
+
+    :param directory_path: Path to the directory to be removed.
+    """
+    if os.path.exists(directory_path):
+        shutil.rmtree(directory_path)
+        logger.debug(f"Directory '{directory_path}' has been removed.")
+    else:
+        logger.debug(f"Directory '{directory_path}' does not exist.")
+def clear_directory(directory_path):
+    """
+    Clears all files and subdirectories within the specified directory.
+
+    Parameters:
+    directory_path (str): The path to the directory to be cleared.
+    """
+    # Check if the directory exists
+    if os.path.exists(directory_path):
+        # Iterate over all the files and directories within the specified directory
+        for item in os.listdir(directory_path):
+            item_path = os.path.join(directory_path, item)
+            # If it's a directory, remove it and its contents
+            if os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+            # If it's a file, remove it
+            elif os.path.isfile(item_path) or os.path.islink(item_path):
+                os.unlink(item_path)
+    else:
+        logger.warning(f"The directory {directory_path} does not exist.")
+
+
+def recreate_directory(directory):
+    """
+    Recreates the specified directory. If it already exists, it is removed first.
+    
+    Args:
+    - directory (str): The path of the directory to recreate.
+    """
+    if os.path.exists(directory):
+        shutil.rmtree(directory)  # Remove the directory and its contents
+        logger.debug(f"Directory removed: {directory}")
+    
+    os.makedirs(directory)  # Recreate the directory
+    logger.debug(f"Directory created: {directory}")